@@ -3,7 +3,8 @@
 Batch Financial Report Generator
 
 Automates generation of financial reports using Smart Threshold & Dynamic Mapping Strategy.
-Uses ONLY gemini-3-pro-preview for all AI operations with robust exponential backoff retry logic.
+Uses gemini-3-pro-preview for report sections and a Flash model for structure mapping,
+with robust exponential backoff retry logic.
 
 Key Features:
 - Heavy report detection (>300 pages)
@@ -12,19 +13,41 @@ Key Features:
 - Exponential backoff for rate limit handling
 """
 
+import io
 import os
-import sys
+import re
+import html
+import hashlib
+import argparse
 import time
+import random
 import logging
 import json
+import datetime
+import email.utils
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Optional, Callable, Any
+from types import MappingProxyType
+from typing import Optional, Callable, Any, Iterator, Union
 
 from dotenv import load_dotenv
 import requests
+from requests.adapters import HTTPAdapter
 import google.generativeai as genai
 from google.api_core import exceptions as google_exceptions
 import fitz  # PyMuPDF - faster and better with Hebrew than PyPDF2
+from typing_extensions import TypedDict  # Gemini schema conversion needs it below Python 3.12
+
+# orjson decodes response bytes directly and is several times faster on large
+# HTML payloads; fall back to the stdlib decoder when it is not installed
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
 # Load environment variables from .env file
 load_dotenv()
@@ -35,9 +58,6 @@ HEBREW_MONTHS = [
     'יולי', 'אוגוסט', 'ספטמבר', 'אוקטובר', 'נובמבר', 'דצמבר'
 ]
 
-# Optional: filter to specific company (pass as command line argument)
-COMPANY_FILTER = sys.argv[1] if len(sys.argv) > 1 else None
-
 # Configuration - paths can be overridden via environment variables
 FINANCIAL_REPORTS_DIR = Path(os.getenv("FINANCIAL_REPORTS_DIR", "./Financial_Reports"))
 OUTPUT_DIR = Path(os.getenv("OUTPUT_DIR", "./All_Reports"))
@@ -46,12 +66,18 @@ SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY", "")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
 
 # ============================================================
-# MODEL CONFIGURATION - SINGLE MODEL FOR EVERYTHING
+# MODEL CONFIGURATION - PRO FOR SECTIONS, FLASH FOR STRUCTURE MAPPING
 # ============================================================
 MODEL_NAME = "gemini-3-pro-preview"
+STRUCTURE_MODEL_NAME = "gemini-flash-latest"  # Cheaper model for the TOC -> page-range JSON extraction
+
+# Explicit Gemini context caching: upload-once PDFs are cached per company and
+# the Edge Function reuses the cache instead of re-reading the files per section
+ENABLE_CONTEXT_CACHE = os.getenv("ENABLE_CONTEXT_CACHE", "false").lower() == "true"
+CONTEXT_CACHE_TTL_MINUTES = 30
 
 # Report sections to generate (must match Edge Function's valid sectionIds)
-SECTIONS = [
+SECTIONS = (
     'company_profile',
     'executive_summary',
     'business_environment',
@@ -60,36 +86,128 @@ SECTIONS = [
     'financial_analysis',
     'cash_flow_and_liquidity',
     'liquidation_analysis'
-]
+)
 
 # Section routing for heavy reports
-BOARD_REPORT_SECTIONS = {
+BOARD_REPORT_SECTIONS = frozenset({
     'company_profile',
     'executive_summary',
     'business_environment',
     'asset_portfolio_analysis'
-}
+})
 
-FINANCIAL_STATEMENTS_SECTIONS = {
+FINANCIAL_STATEMENTS_SECTIONS = frozenset({
     'debt_structure',
     'financial_analysis',
     'cash_flow_and_liquidity',
     'liquidation_analysis'
+})
+
+# Section display names (Hebrew) - read-only, shared by all worker threads
+SECTION_DISPLAY_NAMES = MappingProxyType({
+    'company_profile': 'פרופיל חברה',
+    'executive_summary': 'תקציר מנהלים',
+    'business_environment': 'סביבה עסקית',
+    'asset_portfolio_analysis': 'ניתוח תיק נכסים',
+    'debt_structure': 'מבנה חוב',
+    'financial_analysis': 'ניתוח פיננסי',
+    'cash_flow_and_liquidity': 'תזרים מזומנים ונזילות',
+    'liquidation_analysis': 'ניתוח פירוק'
+})
+
+# Token-limit error signatures, matched in a single case-insensitive pass
+TOKEN_LIMIT_RE = re.compile(
+    r'token|limit|exceed|invalidargument|resourceexhausted|too large|context length',
+    re.IGNORECASE
+)
+RATE_LIMIT_RE = re.compile(
+    r'too many requests|rate limit|quota|429|resource exhausted',
+    re.IGNORECASE
+)
+# Transient Gemini SDK errors retried with backoff, and how each is logged
+RETRYABLE_SDK_ERRORS = {
+    google_exceptions.ResourceExhausted: "Rate limit hit",
+    google_exceptions.ServiceUnavailable: "Service unavailable",
+    google_exceptions.DeadlineExceeded: "Timeout",
 }
+RETRYABLE_SDK_ERROR_TYPES = tuple(RETRYABLE_SDK_ERRORS)
+# Rate-limit signatures in Gemini SDK exception messages (generation and uploads)
+SDK_RATE_LIMIT_RE = re.compile(r'429|resource|exhausted|quota', re.IGNORECASE)
+ERROR_SNIPPET_BYTES = 512  # Error keywords appear up front - don't scan whole bodies/messages
+RETRYABLE_STATUS_CODES = frozenset({500, 502, 503, 504})  # Transient server/gateway errors
 
-# Delay between API calls (seconds)
+# Sustained spacing between Edge Function calls across all threads (seconds)
 API_DELAY = 5.0
 
+# Companies processed in parallel (each one's work is network-bound)
+MAX_CONCURRENT_COMPANIES = int(os.getenv("MAX_CONCURRENT_COMPANIES", "2"))
+
+# Section API calls in flight per company
+MAX_CONCURRENT_SECTIONS = int(os.getenv("MAX_CONCURRENT_SECTIONS", "4"))
+
+# Edge Function calls allowed back-to-back before API_DELAY spacing applies
+API_BURST = MAX_CONCURRENT_SECTIONS
+
 # ============================================================
 # RETRY CONFIGURATION - EXPONENTIAL BACKOFF FOR ALL API CALLS
 # ============================================================
 MAX_RETRIES = 6
 BASE_DELAY = 30  # Starting delay in seconds
 MAX_DELAY = 600  # Maximum delay (10 minutes)
+RETRY_JITTER = 0.2  # Up to +20% random extra wait, so callers that failed together retry apart
+BREAKER_FAILURE_THRESHOLD = 5  # Consecutive section-call failures (429/5xx/timeout) that open the circuit
+BREAKER_COOLDOWN = 60  # Seconds section calls fail fast once the circuit is open
+UPLOAD_PROCESSING_TIMEOUT = 600  # Give up on an upload still PROCESSING after this many seconds
 
 # Heavy report threshold (pages)
 HEAVY_REPORT_THRESHOLD = 300
 
+# Pages with less text (covers, charts, photos) are left out of the TOC text
+TOC_MIN_PAGE_CHARS = 200
+TOC_MAX_CHARS = 12000  # TOC text budget for the mapping prompt
+TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_IMAGES
+
+# Token preflight - skip the two-file attempt when inputs clearly exceed the context
+ESTIMATED_TOKENS_PER_PAGE = 1000  # Rough Gemini input tokens per PDF page (image + text)
+PHASE1_TOKEN_BUDGET = 900_000
+
+# Fallback mapping: a page with this many digits, making up this share of its
+# text, is taken as the first financial statements table
+FINANCIAL_MIN_DIGITS = 40
+FINANCIAL_DIGIT_RATIO = 0.15
+
+
+class PageRange(TypedDict):
+    start: int
+    end: int
+
+
+class StructureMap(TypedDict):
+    board_report: PageRange
+    financial_statements: PageRange
+    notes: PageRange
+
+
+# Structured output - Gemini returns exactly one StructureMap JSON object, no prose or fences
+STRUCTURE_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": StructureMap,
+    "temperature": 0,
+}
+
+
+# Filename keywords used to classify a company's PDFs
+ANNUAL_KEYWORDS = ("annual", "שנתי")
+QUARTERLY_KEYWORDS = ("quarter", "רבעוני", "q1", "q2", "q3", "q4")
+ANNUAL_RE = re.compile("|".join(map(re.escape, ANNUAL_KEYWORDS)), re.IGNORECASE)
+QUARTERLY_RE = re.compile("|".join(map(re.escape, QUARTERLY_KEYWORDS)), re.IGNORECASE)
+
+# Banner line used in log output
+SEPARATOR = "=" * 60
+
+# Successfully generated sections are wrapped in <div class="section" id="...">
+SECTION_ID_RE = re.compile(r'<div class="section" id="([^"]+)"')
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -98,20 +216,59 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Global model instance - initialized once
+# Shared HTTP session for the Edge Function - keeps TCP/TLS connections alive
+# across section calls instead of reconnecting for every request
+http_session = requests.Session()
+http_session.headers.update({
+    "Content-Type": "application/json",
+    "Authorization": f"Bearer {SUPABASE_ANON_KEY}"
+})
+http_session.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=MAX_CONCURRENT_COMPANIES * MAX_CONCURRENT_SECTIONS,  # One per in-flight call
+    max_retries=0  # Retries are handled by call_section_api
+))
+
+# Global model instances - initialized once
 gemini_model: Optional[genai.GenerativeModel] = None
+structure_model: Optional[genai.GenerativeModel] = None
+configure_lock = threading.Lock()
 
 
 # ============================================================
 # CORE RETRY WRAPPER - USED FOR ALL GEMINI API CALLS
 # ============================================================
 
+def backoff_delay(base_delay: float, attempt: int) -> float:
+    """Exponential backoff capped at MAX_DELAY, stretched by up to RETRY_JITTER."""
+    delay = min(base_delay * (2 ** attempt), MAX_DELAY)
+    return round(delay * random.uniform(1, 1 + RETRY_JITTER), 1)
+
+
+def suggested_retry_delay(error: Exception) -> Optional[float]:
+    """Return the retry delay a Google API error carries (google.rpc.RetryInfo), if any."""
+    for detail in getattr(error, "details", None) or []:
+        if isinstance(detail, dict):
+            delay = detail.get("retryDelay")
+            if isinstance(delay, str) and delay.endswith("s"):
+                try:
+                    return float(delay[:-1])
+                except ValueError:
+                    continue
+        else:
+            delay = getattr(detail, "retry_delay", None)
+            if delay is not None:
+                return delay.seconds + delay.nanos / 1e9
+    return None
+
+
 def generate_with_retry(
     prompt: str,
     model: genai.GenerativeModel,
     operation_name: str = "API call",
     max_retries: int = MAX_RETRIES,
-    base_delay: int = BASE_DELAY
+    base_delay: int = BASE_DELAY,
+    generation_config: Optional[dict] = None
 ) -> Optional[str]:
     """
     Execute a Gemini API call with exponential backoff retry logic.
@@ -128,6 +285,7 @@ def generate_with_retry(
         operation_name: Description of the operation for logging
         max_retries: Maximum number of retry attempts
         base_delay: Base delay in seconds for exponential backoff
+        generation_config: Optional Gemini generation config (e.g. JSON mode + schema)
 
     Returns:
         Response text or None if all retries failed
@@ -136,9 +294,9 @@ def generate_with_retry(
 
     for attempt in range(max_retries):
         try:
-            logger.debug(f"  {operation_name}: Attempt {attempt + 1}/{max_retries}")
+            logger.debug("  %s: Attempt %d/%d", operation_name, attempt + 1, max_retries)
 
-            response = model.generate_content(prompt)
+            response = model.generate_content(prompt, generation_config=generation_config)
 
             if response and response.text:
                 return response.text.strip()
@@ -146,36 +304,23 @@ def generate_with_retry(
                 logger.warning(f"  {operation_name}: Empty response on attempt {attempt + 1}")
                 last_error = "Empty response"
 
-        except google_exceptions.ResourceExhausted as e:
-            # Rate limit - use exponential backoff
-            wait_time = min(base_delay * (2 ** attempt), MAX_DELAY)
-            logger.warning(f"⏳ Rate limit hit for {operation_name}. Waiting {wait_time}s before retry {attempt + 1}/{max_retries}...")
-            time.sleep(wait_time)
-            last_error = str(e)
-            continue
-
-        except google_exceptions.ServiceUnavailable as e:
-            # Server overloaded - wait and retry
-            wait_time = min(base_delay * (2 ** attempt), MAX_DELAY)
-            logger.warning(f"⏳ Service unavailable for {operation_name}. Waiting {wait_time}s before retry {attempt + 1}/{max_retries}...")
-            time.sleep(wait_time)
-            last_error = str(e)
-            continue
-
-        except google_exceptions.DeadlineExceeded as e:
-            # Timeout - wait and retry
-            wait_time = min(base_delay * (2 ** attempt), MAX_DELAY)
-            logger.warning(f"⏳ Timeout for {operation_name}. Waiting {wait_time}s before retry {attempt + 1}/{max_retries}...")
+        except RETRYABLE_SDK_ERROR_TYPES as e:
+            # Rate limit / overload / timeout - use the server's suggested delay, else exponential backoff
+            label = next(text for cls, text in RETRYABLE_SDK_ERRORS.items() if isinstance(e, cls))
+            suggested = suggested_retry_delay(e)
+            wait_time = (
+                backoff_delay(suggested, 0) if suggested is not None
+                else backoff_delay(base_delay, attempt)
+            )
+            logger.warning(f"⏳ {label} for {operation_name}. Waiting {wait_time}s before retry {attempt + 1}/{max_retries}...")
             time.sleep(wait_time)
             last_error = str(e)
             continue
 
         except Exception as e:
-            error_str = str(e).lower()
-
             # Check if it's a rate limit error in the message
-            if '429' in error_str or 'resource' in error_str or 'exhausted' in error_str or 'quota' in error_str:
-                wait_time = min(base_delay * (2 ** attempt), MAX_DELAY)
+            if SDK_RATE_LIMIT_RE.search(str(e), 0, ERROR_SNIPPET_BYTES):
+                wait_time = backoff_delay(base_delay, attempt)
                 logger.warning(f"⏳ Rate limit (from error message) for {operation_name}. Waiting {wait_time}s before retry {attempt + 1}/{max_retries}...")
                 time.sleep(wait_time)
                 last_error = str(e)
@@ -198,18 +343,26 @@ def generate_with_retry(
 # ============================================================
 
 def configure_gemini() -> genai.GenerativeModel:
-    """Configure Google Generative AI and return the model instance."""
-    global gemini_model
+    """Configure Google Generative AI and return the model instance (idempotent)."""
+    global gemini_model, structure_model
+
+    if gemini_model is not None:
+        return gemini_model
 
     if not GOOGLE_API_KEY:
         raise ValueError("GOOGLE_API_KEY environment variable is not set")
 
-    genai.configure(api_key=GOOGLE_API_KEY)
+    with configure_lock:
+        if gemini_model is None:
+            genai.configure(api_key=GOOGLE_API_KEY)
 
-    # Initialize the single model instance
-    gemini_model = genai.GenerativeModel(MODEL_NAME)
+            # Pro for section generation, Flash for structure mapping
+            # (structure model first - it is ready once gemini_model is set)
+            structure_model = genai.GenerativeModel(STRUCTURE_MODEL_NAME)
+            gemini_model = genai.GenerativeModel(MODEL_NAME)
 
-    logger.info(f"Gemini API configured successfully with model: {MODEL_NAME}")
+            logger.info(f"Gemini API configured successfully with model: {MODEL_NAME}")
+            logger.info(f"Structure mapping model: {STRUCTURE_MODEL_NAME}")
     return gemini_model
 
 
@@ -217,22 +370,20 @@ def configure_gemini() -> genai.GenerativeModel:
 # HTML TEMPLATE
 # ============================================================
 
-def get_html_template(company_name: str) -> str:
-    """Returns the HTML header template with RTL support and Hebrew fonts."""
-    return f"""<!DOCTYPE html>
+# Static document head (styles only) - built once at import time
+_HTML_PREFIX = """<!DOCTYPE html>
 <html dir="rtl" lang="he">
 <head>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>דוח פיננסי - {company_name}</title>
     <style>
         @import url('https://fonts.googleapis.com/css2?family=Heebo:wght@300;400;500;700&display=swap');
 
-        * {{
+        * {
             box-sizing: border-box;
-        }}
+        }
 
-        body {{
+        body {
             font-family: 'Heebo', Arial, sans-serif;
             direction: rtl;
             text-align: right;
@@ -242,102 +393,115 @@ def get_html_template(company_name: str) -> str:
             margin: 0 auto;
             padding: 40px 20px;
             background-color: #f5f5f5;
-        }}
+        }
 
-        .report-container {{
+        .report-container {
             background: white;
             padding: 40px;
             border-radius: 8px;
             box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-        }}
+        }
 
-        h1 {{
+        h1 {
             color: #1a365d;
             border-bottom: 3px solid #2c5282;
             padding-bottom: 15px;
             margin-bottom: 30px;
-        }}
+        }
 
-        h2 {{
+        h2 {
             color: #2c5282;
             margin-top: 40px;
             padding-bottom: 10px;
             border-bottom: 2px solid #e2e8f0;
-        }}
+        }
 
-        h3 {{
+        h3 {
             color: #4a5568;
             margin-top: 25px;
-        }}
+        }
 
-        table {{
+        table {
             width: 100%;
             border-collapse: collapse;
             margin: 20px 0;
             font-size: 14px;
-        }}
+        }
 
-        th, td {{
+        th, td {
             border: 1px solid #e2e8f0;
             padding: 12px 15px;
             text-align: right;
-        }}
+        }
 
-        th {{
+        th {
             background-color: #2c5282;
             color: white;
             font-weight: 500;
-        }}
+        }
 
-        tr:nth-child(even) {{
+        tr:nth-child(even) {
             background-color: #f7fafc;
-        }}
+        }
 
-        tr:hover {{
+        tr:hover {
             background-color: #edf2f7;
-        }}
+        }
 
-        .section {{
+        .section {
             margin-bottom: 40px;
             padding: 20px;
             background: #fafafa;
             border-radius: 6px;
             border-right: 4px solid #2c5282;
-        }}
+        }
 
-        .error {{
+        .error {
             background-color: #fed7d7;
             color: #c53030;
             padding: 15px;
             border-radius: 6px;
             margin: 10px 0;
             border-right: 4px solid #c53030;
-        }}
+        }
 
-        .highlight {{
+        .highlight {
             background-color: #fefcbf;
             padding: 2px 6px;
             border-radius: 3px;
-        }}
+        }
 
-        ul, ol {{
+        ul, ol {
             padding-right: 25px;
-        }}
+        }
 
-        li {{
+        li {
             margin-bottom: 8px;
-        }}
+        }
 
-        .meta-info {{
+        .meta-info {
             color: #718096;
             font-size: 12px;
             margin-bottom: 30px;
-        }}
+        }
     </style>
+"""
+
+_HTML_FOOTER = """
+    </div>
+</body>
+</html>
+"""
+
+
+def get_html_template(company_name: str) -> str:
+    """Returns the per-company part of the HTML header (follows _HTML_PREFIX)."""
+    safe_name = html.escape(company_name)  # Directory names are never trusted as markup
+    return f"""    <title>דוח פיננסי - {safe_name}</title>
 </head>
 <body>
     <div class="report-container">
-        <h1>דוח פיננסי מקיף - {company_name}</h1>
+        <h1>דוח פיננסי מקיף - {safe_name}</h1>
         <div class="meta-info">
             נוצר באופן אוטומטי | תאריך יצירה: {time.strftime('%d/%m/%Y %H:%M')}
         </div>
@@ -346,24 +510,43 @@ def get_html_template(company_name: str) -> str:
 
 def get_html_footer() -> str:
     """Returns the HTML footer."""
-    return """
-    </div>
-</body>
-</html>
-"""
+    return _HTML_FOOTER
 
 
 # ============================================================
 # PDF HANDLING WITH PYMUPDF (FITZ)
 # ============================================================
 
-def get_pdf_page_count(pdf_path: Path) -> int:
-    """Get the total page count of a PDF using PyMuPDF."""
+@contextmanager
+def opened_pdf(pdf_path: Path) -> Iterator[Optional[fitz.Document]]:
+    """
+    Open a PDF once for a whole processing step and close it afterwards.
+    Yields None (and logs) if the file cannot be opened.
+    """
     try:
         doc = fitz.open(str(pdf_path))
-        count = doc.page_count
+    except Exception as e:
+        logger.error(f"Error opening PDF {pdf_path.name}: {e}")
+        yield None
+        return
+    try:
+        yield doc
+    finally:
         doc.close()
-        return count
+
+
+@lru_cache(maxsize=256)
+def cached_page_count(path: str, mtime_ns: int, size: int) -> int:
+    """Page count memoized per file version - (mtime, size) change when the file does."""
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+
+def get_pdf_page_count(pdf_path: Path) -> int:
+    """Get the total page count of a PDF using PyMuPDF (each file version is opened once)."""
+    try:
+        stat = pdf_path.stat()
+        return cached_page_count(str(pdf_path), stat.st_mtime_ns, stat.st_size)
     except Exception as e:
         logger.error(f"Error getting page count for {pdf_path.name}: {e}")
         return 0
@@ -375,29 +558,40 @@ def extract_toc_text(pdf_path: Path, max_pages: int = 30) -> str:
     PyMuPDF is faster and handles Hebrew text better than PyPDF2.
     """
     try:
-        doc = fitz.open(str(pdf_path))
-        toc_text = []
+        with fitz.open(str(pdf_path)) as doc:
+            return extract_toc_text_from_doc(doc, max_pages)
+    except Exception as e:
+        logger.error(f"Error extracting TOC text from {pdf_path.name}: {e}")
+        return ""
 
-        pages_to_scan = min(max_pages, doc.page_count)
-        logger.info(f"  Extracting TOC text from first {pages_to_scan} pages...")
 
-        for i in range(pages_to_scan):
-            page = doc[i]
-            text = page.get_text()
-            if text:
-                toc_text.append(f"--- Page {i + 1} ---\n{text}")
+def extract_toc_text_from_doc(doc: fitz.Document, max_pages: int = 30) -> str:
+    """Extract TOC-area text from an already opened PyMuPDF document."""
+    toc_text = []
+    total_chars = 0
 
-        doc.close()
-        return "\n".join(toc_text)
+    pages_to_scan = min(max_pages, doc.page_count)
+    logger.info(f"  Extracting TOC text from first {pages_to_scan} pages...")
 
-    except Exception as e:
-        logger.error(f"Error extracting TOC text from {pdf_path.name}: {e}")
-        return ""
+    for i in range(pages_to_scan):
+        text = doc[i].get_text("text", flags=TEXT_FLAGS)
+        # Skip image-heavy pages - they only add noise to the mapping prompt
+        if len(text.strip()) >= TOC_MIN_PAGE_CHARS:
+            toc_text.append(f"--- Page {i + 1} ---\n{text}")
+            total_chars += len(toc_text[-1]) + 1
+            if total_chars >= TOC_MAX_CHARS:
+                break  # The prompt keeps only TOC_MAX_CHARS - later pages would be cut anyway
+
+    return "\n".join(toc_text)
 
 
-def map_report_structure(pdf_path: Path, model: genai.GenerativeModel) -> dict:
+def map_report_structure(
+    pdf_path: Path,
+    model: genai.GenerativeModel,
+    source_doc: Optional[fitz.Document] = None
+) -> dict:
     """
-    Use AI (gemini-3-pro-preview) to analyze TOC and identify page ranges for report sections.
+    Use AI (STRUCTURE_MODEL_NAME, a Flash model) to analyze TOC and identify page ranges for report sections.
     Uses generate_with_retry for robust error handling.
 
     Returns a dictionary with page ranges:
@@ -408,19 +602,33 @@ def map_report_structure(pdf_path: Path, model: genai.GenerativeModel) -> dict:
     }
 
     Falls back to default percentage-based ranges if AI mapping fails.
+    Pass an already opened source_doc to avoid re-parsing pdf_path.
     """
-    doc = fitz.open(str(pdf_path))
-    total_pages = doc.page_count
-    doc.close()
-
     logger.info(f"  Running AI-powered structure mapping on {pdf_path.name}...")
 
-    # Extract TOC text from first 30 pages
-    toc_text = extract_toc_text(pdf_path, max_pages=30)
+    # One open serves the page count, the TOC text and the fallback density scan
+    if source_doc is not None:
+        return map_structure_from_doc(pdf_path, source_doc, model)
+    with fitz.open(str(pdf_path)) as doc:
+        return map_structure_from_doc(pdf_path, doc, model)
+
+
+def map_structure_from_doc(
+    pdf_path: Path,
+    doc: fitz.Document,
+    model: genai.GenerativeModel
+) -> dict:
+    """Structure mapping on an already opened document (see map_report_structure)."""
+    total_pages = doc.page_count
+    try:
+        toc_text = extract_toc_text_from_doc(doc, max_pages=30)
+    except Exception as e:
+        logger.error(f"Error extracting TOC text from {pdf_path.name}: {e}")
+        toc_text = ""
 
     if not toc_text:
         logger.warning("  Could not extract TOC text, using fallback ranges")
-        return get_default_structure_map(total_pages)
+        return fallback_structure_map(pdf_path, total_pages, doc)
 
     # Strict prompt for JSON output
     prompt = f"""You are analyzing the Table of Contents of an Israeli financial report.
@@ -440,43 +648,23 @@ Page numbers should be 1-indexed (first page = 1).
 Analyze carefully and provide accurate page ranges based on the TOC below.
 
 TOC TEXT:
-{toc_text[:12000]}"""
+{toc_text[:TOC_MAX_CHARS]}"""
 
     # Use retry wrapper for the API call
     response_text = generate_with_retry(
         prompt=prompt,
         model=model,
-        operation_name="Structure Mapping"
+        operation_name="Structure Mapping",
+        generation_config=STRUCTURE_GENERATION_CONFIG
     )
 
     if not response_text:
         logger.warning("  AI mapping returned no response, using fallback ranges")
-        return get_default_structure_map(total_pages)
+        return fallback_structure_map(pdf_path, total_pages, doc)
 
-    # Parse JSON response
+    # Parse JSON response (JSON mode - no markdown or prose to strip)
     try:
-        # Clean up response - remove any markdown or extra text
-        clean_response = response_text.strip()
-
-        # Remove markdown code blocks if present
-        if '```' in clean_response:
-            # Extract content between code blocks
-            parts = clean_response.split('```')
-            for part in parts:
-                part = part.strip()
-                if part.startswith('json'):
-                    part = part[4:].strip()
-                if part.startswith('{') and part.endswith('}'):
-                    clean_response = part
-                    break
-
-        # Find the JSON object in the response
-        start_idx = clean_response.find('{')
-        end_idx = clean_response.rfind('}') + 1
-        if start_idx != -1 and end_idx > start_idx:
-            clean_response = clean_response[start_idx:end_idx]
-
-        structure_map = json.loads(clean_response)
+        structure_map = json.loads(response_text)
 
         # Validate and convert to 0-indexed
         validated_map = {}
@@ -501,21 +689,58 @@ TOC TEXT:
     except json.JSONDecodeError as e:
         logger.warning(f"  Failed to parse AI response as JSON: {e}")
         logger.warning(f"  Response was: {response_text[:300]}...")
-        return get_default_structure_map(total_pages)
+        return fallback_structure_map(pdf_path, total_pages, doc)
     except Exception as e:
         logger.warning(f"  AI mapping parsing failed: {e}")
-        return get_default_structure_map(total_pages)
+        return fallback_structure_map(pdf_path, total_pages, doc)
 
 
-def get_default_structure_map(total_pages: int) -> dict:
+def find_financial_start_by_density(doc: fitz.Document, from_page: int) -> Optional[int]:
+    """
+    Return the first page from from_page onward whose text is dense in digits
+    (balance sheet / P&L tables), or None if there is none.
+    """
+    for page_index in range(max(0, from_page), doc.page_count):
+        text = doc[page_index].get_text("text", flags=TEXT_FLAGS)
+        digits = sum(map(str.isdigit, text))
+        if digits >= FINANCIAL_MIN_DIGITS and digits / len(text) >= FINANCIAL_DIGIT_RATIO:
+            return page_index
+    return None
+
+
+def fallback_structure_map(
+    pdf_path: Path,
+    total_pages: int,
+    source_doc: Optional[fitz.Document] = None
+) -> dict:
+    """Default ranges, anchored on the first digit-dense page past mid-report when one exists."""
+    try:
+        if source_doc is not None:
+            financial_start = find_financial_start_by_density(source_doc, total_pages // 2)
+        else:
+            with fitz.open(str(pdf_path)) as doc:
+                financial_start = find_financial_start_by_density(doc, total_pages // 2)
+    except Exception as e:
+        logger.warning(f"  Numeric density scan failed for {pdf_path.name}: {e}")
+        financial_start = None
+
+    if financial_start is not None:
+        logger.info(f"  Financial tables detected from page {financial_start + 1} (numeric density)")
+    return get_default_structure_map(total_pages, financial_start)
+
+
+def get_default_structure_map(total_pages: int, financial_start: Optional[int] = None) -> dict:
     """
     Return default page ranges based on typical Israeli financial report structure.
+    A detected financial_start (0-indexed) replaces the 25% guess.
     """
     logger.info(f"  Using default structure mapping for {total_pages} pages")
 
     board_end = int(total_pages * 0.25)
-    financial_start = board_end
-    financial_end = int(total_pages * 0.60)
+    if financial_start is None:
+        financial_start = board_end
+    board_end = min(board_end, financial_start)
+    financial_end = max(int(total_pages * 0.60), financial_start)
     notes_start = financial_end
 
     structure = {
@@ -530,47 +755,71 @@ def get_default_structure_map(total_pages: int) -> dict:
     return structure
 
 
-def slice_pdf_fitz(pdf_path: Path, start_page: int, end_page: int, output_path: Path) -> Optional[Path]:
-    """Create a new PDF containing only the specified page range using PyMuPDF."""
+def slice_pdf_fitz(
+    pdf_path: Path,
+    start_page: int,
+    end_page: int,
+    source_doc: Optional[fitz.Document] = None
+) -> Optional[bytes]:
+    """
+    Create a new in-memory PDF containing only the specified page range using PyMuPDF.
+    Pass an already opened source_doc to avoid re-parsing pdf_path for every slice.
+    """
     try:
-        doc = fitz.open(str(pdf_path))
-        total_pages = doc.page_count
-
-        start_page = max(0, start_page)
-        end_page = min(total_pages - 1, end_page)
+        doc = source_doc if source_doc is not None else fitz.open(str(pdf_path))
+        try:
+            total_pages = doc.page_count
 
-        if start_page > end_page:
-            logger.error(f"Invalid page range: {start_page} to {end_page}")
-            doc.close()
-            return None
+            start_page = max(0, start_page)
+            end_page = min(total_pages - 1, end_page)
 
-        new_doc = fitz.open()
-        new_doc.insert_pdf(doc, from_page=start_page, to_page=end_page)
+            if start_page > end_page:
+                logger.error(f"Invalid page range: {start_page} to {end_page}")
+                return None
 
-        new_doc.save(str(output_path))
-        new_doc.close()
-        doc.close()
+            with fitz.open() as new_doc:
+                # Annotations and links are never read by the model - don't copy them
+                new_doc.insert_pdf(
+                    doc, from_page=start_page, to_page=end_page, annots=False, links=False
+                )
+                # Drop orphaned/duplicate objects and compress streams - smaller uploads
+                slice_bytes = new_doc.tobytes(garbage=3, deflate=True, deflate_images=True)
+        finally:
+            if source_doc is None:
+                doc.close()
 
         pages_extracted = end_page - start_page + 1
-        logger.info(f"    Created slice: {output_path.name} ({pages_extracted} pages)")
+        logger.info(f"    Created slice: pages {start_page + 1}-{end_page + 1} ({pages_extracted} pages)")
 
-        return output_path
+        return slice_bytes
 
     except Exception as e:
         logger.error(f"Error slicing PDF {pdf_path.name}: {e}")
         return None
 
 
-def create_report_slices(pdf_path: Path, structure_map: dict, output_dir: Path) -> dict:
-    """Create sliced PDFs based on the structure map."""
+def create_report_slices(
+    pdf_path: Path,
+    structure_map: dict,
+    source_doc: Optional[fitz.Document] = None
+) -> dict:
+    """
+    Create in-memory PDF slices (bytes) based on the structure map (the source PDF is opened once).
+    Pass an already opened source_doc to reuse the caller's document.
+    """
+    if source_doc is None:
+        with opened_pdf(pdf_path) as doc:
+            if doc is None:
+                return {}
+            return create_report_slices(pdf_path, structure_map, doc)
+
     slices = {}
 
     # Create board report slice
     board_range = structure_map.get('board_report', {})
     if board_range:
-        board_path = output_dir / f"slice_board_{pdf_path.stem}.pdf"
         slices['board_slice'] = slice_pdf_fitz(
-            pdf_path, board_range['start'], board_range['end'], board_path
+            pdf_path, board_range['start'], board_range['end'], source_doc
         )
 
     # Create financial slice (financial_statements + notes combined)
@@ -580,17 +829,25 @@ def create_report_slices(pdf_path: Path, structure_map: dict, output_dir: Path)
     if fin_range and notes_range:
         start = fin_range['start']
         end = notes_range['end']
-        financial_path = output_dir / f"slice_financial_{pdf_path.stem}.pdf"
-        slices['financial_slice'] = slice_pdf_fitz(pdf_path, start, end, financial_path)
+        slices['financial_slice'] = slice_pdf_fitz(pdf_path, start, end, source_doc)
     elif fin_range:
-        financial_path = output_dir / f"slice_financial_{pdf_path.stem}.pdf"
         slices['financial_slice'] = slice_pdf_fitz(
-            pdf_path, fin_range['start'], fin_range['end'], financial_path
+            pdf_path, fin_range['start'], fin_range['end'], source_doc
         )
 
     return slices
 
 
+def get_pdf_bytes_page_count(pdf_bytes: bytes) -> int:
+    """Get the page count of an in-memory PDF (e.g. a slice)."""
+    try:
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            return doc.page_count
+    except Exception as e:
+        logger.error(f"Error getting page count of in-memory PDF: {e}")
+        return 0
+
+
 def is_heavy_report(pdf_path: Path) -> tuple[bool, int]:
     """Check if a PDF is a heavy report (exceeds page threshold)."""
     total_pages = get_pdf_page_count(pdf_path)
@@ -602,60 +859,144 @@ def find_pdf_files(company_dir: Path) -> tuple[Optional[Path], Optional[Path]]:
     """Find Annual and Quarterly PDF files in a company directory."""
     annual_pdf = None
     quarterly_pdf = None
+    pdfs = []
 
-    for file in company_dir.glob("*.pdf"):
-        filename = file.name.lower()
-        if "annual" in filename or "שנתי" in filename:
-            annual_pdf = file
-        elif any(q in filename for q in ["quarter", "רבעוני", "q1", "q2", "q3", "q4"]):
-            quarterly_pdf = file
+    # Single directory pass: collect PDFs and classify them by name
+    with os.scandir(company_dir) as it:
+        for entry in it:
+            if entry.name.startswith('.') or not entry.name.lower().endswith('.pdf'):
+                continue
+            pdfs.append(entry.name)
+            if ANNUAL_RE.search(entry.name):
+                annual_pdf = entry.name
+            elif QUARTERLY_RE.search(entry.name):
+                quarterly_pdf = entry.name
+
+    # Fallback: use first PDF as annual, second as quarterly
+    if annual_pdf is None and pdfs:
+        pdfs.sort()
+        annual_pdf = pdfs[0]
+        if len(pdfs) > 1:
+            quarterly_pdf = pdfs[1]
+
+    return (
+        company_dir / annual_pdf if annual_pdf else None,
+        company_dir / quarterly_pdf if quarterly_pdf else None
+    )
+
+
+# Gemini files already uploaded, by content hash (sha1 -> file name).
+# Persisted so reruns within Gemini's 48h file TTL reuse earlier uploads.
+UPLOAD_REGISTRY_FILE = OUTPUT_DIR / "uploaded_files.json"
+uploaded_files: Optional[dict[str, str]] = None
+upload_registry_lock = threading.Lock()  # Companies upload from several threads
 
-    if annual_pdf is None:
-        pdfs = sorted(company_dir.glob("*.pdf"))
-        if pdfs:
-            annual_pdf = pdfs[0]
-            if len(pdfs) > 1:
-                quarterly_pdf = pdfs[1]
 
-    return annual_pdf, quarterly_pdf
+def file_sha1(path: Path) -> str:
+    """Return the SHA-1 hex digest of a file, reading it in 1 MB chunks."""
+    sha = hashlib.sha1()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
 
 
-def upload_pdf_to_gemini(pdf_path: Path, max_retries: int = 5) -> Optional[str]:
-    """Upload a PDF file to Gemini with retry logic."""
-    logger.info(f"Uploading {pdf_path.name} to Gemini...")
+def get_upload_registry() -> dict[str, str]:
+    """Load the persisted upload registry on first use."""
+    global uploaded_files
+    with upload_registry_lock:
+        if uploaded_files is None:
+            try:
+                uploaded_files = json.loads(UPLOAD_REGISTRY_FILE.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                uploaded_files = {}
+    return uploaded_files
+
+
+def record_upload(digest: str, file_name: str) -> None:
+    """Remember an upload and persist the registry."""
+    registry = get_upload_registry()
+    with upload_registry_lock:
+        registry[digest] = file_name
+        try:
+            UPLOAD_REGISTRY_FILE.parent.mkdir(parents=True, exist_ok=True)
+            UPLOAD_REGISTRY_FILE.write_text(json.dumps(registry, indent=2), encoding='utf-8')
+        except OSError as e:
+            logger.warning(f"Could not save upload registry: {e}")
+
+
+def find_uploaded_file(digest: str) -> Optional[str]:
+    """Return the URI of a still-active earlier upload with this content hash."""
+    file_name = get_upload_registry().get(digest)
+    if file_name is None:
+        return None
+    try:
+        uploaded_file = genai.get_file(file_name)
+    except Exception:
+        return None  # Expired or deleted - upload again
+    return uploaded_file.uri if uploaded_file.state.name == "ACTIVE" else None
+
+
+def upload_pdf_to_gemini(
+    pdf: Union[Path, bytes],
+    display_name: Optional[str] = None,
+    max_retries: int = 5
+) -> Optional[str]:
+    """
+    Upload a PDF file (path) or in-memory PDF (bytes) to Gemini with retry logic
+    (identical content is uploaded once). display_name defaults to the file name.
+    """
+    is_file = isinstance(pdf, Path)
+    name = display_name or (pdf.name if is_file else "document.pdf")
+    digest = file_sha1(pdf) if is_file else hashlib.sha1(pdf).hexdigest()
+    existing_uri = find_uploaded_file(digest)
+    if existing_uri:
+        logger.info(f"Reusing earlier upload of {name}: {existing_uri}")
+        return existing_uri
+
+    logger.info(f"Uploading {name} to Gemini...")
 
     for attempt in range(max_retries):
         try:
-            uploaded_file = genai.upload_file(
-                path=str(pdf_path),
-                display_name=pdf_path.name
-            )
+            if is_file:
+                uploaded_file = genai.upload_file(path=str(pdf), display_name=name)
+            else:
+                # Slices are streamed from memory - no temporary file round-trip
+                uploaded_file = genai.upload_file(
+                    path=io.BytesIO(pdf), mime_type="application/pdf", display_name=name
+                )
 
-            logger.info(f"Waiting for {pdf_path.name} to be processed...")
+            logger.info(f"Waiting for {name} to be processed...")
+            poll_delay = 0.5  # Short first poll for small files, backing off to 5s
+            processing_deadline = time.monotonic() + UPLOAD_PROCESSING_TIMEOUT
             while uploaded_file.state.name == "PROCESSING":
-                time.sleep(2)
+                if time.monotonic() >= processing_deadline:
+                    logger.error(f"File {name} still processing after {UPLOAD_PROCESSING_TIMEOUT}s, giving up")
+                    return None
+                time.sleep(poll_delay * random.uniform(0.8, 1.2))  # Jitter: keep concurrent polls apart
                 uploaded_file = genai.get_file(uploaded_file.name)
+                poll_delay = min(poll_delay * 1.5, 5.0)
 
             if uploaded_file.state.name == "ACTIVE":
-                logger.info(f"Successfully uploaded {pdf_path.name}: {uploaded_file.uri}")
+                logger.info(f"Successfully uploaded {name}: {uploaded_file.uri}")
+                record_upload(digest, uploaded_file.name)
                 return uploaded_file.uri
             else:
-                logger.error(f"File {pdf_path.name} failed to process. State: {uploaded_file.state.name}")
+                logger.error(f"File {name} failed to process. State: {uploaded_file.state.name}")
                 return None
 
         except Exception as e:
-            error_str = str(e).lower()
-            if '429' in error_str or 'resource' in error_str or 'exhausted' in error_str:
-                wait_time = BASE_DELAY * (2 ** attempt)
+            if SDK_RATE_LIMIT_RE.search(str(e), 0, ERROR_SNIPPET_BYTES):
+                wait_time = backoff_delay(BASE_DELAY, attempt)
                 logger.warning(f"⏳ Rate limit on upload. Waiting {wait_time}s before retry {attempt + 1}/{max_retries}...")
                 time.sleep(wait_time)
                 continue
 
-            logger.warning(f"Upload attempt {attempt + 1} failed for {pdf_path.name}: {e}")
+            logger.warning(f"Upload attempt {attempt + 1} failed for {name}: {e}")
             if attempt < max_retries - 1:
                 time.sleep(5)
             else:
-                logger.error(f"Failed to upload {pdf_path.name} after {max_retries} attempts")
+                logger.error(f"Failed to upload {name} after {max_retries} attempts")
                 return None
 
     return None
@@ -665,22 +1006,127 @@ def upload_pdf_to_gemini(pdf_path: Path, max_retries: int = 5) -> Optional[str]:
 # SECTION GENERATION VIA SUPABASE EDGE FUNCTION
 # ============================================================
 
+def error_snippet(response: requests.Response) -> str:
+    """Decode only the head of an error body for keyword matching."""
+    return response.content[:ERROR_SNIPPET_BYTES].decode("utf-8", "ignore")
+
+
+def retry_after_seconds(response: requests.Response) -> Optional[float]:
+    """Parse a Retry-After header (delta-seconds or HTTP date), if the server sent one."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
 def is_token_limit_error(response: requests.Response) -> bool:
     """Check if the error is related to token limits."""
     if response.status_code == 400:
         return True
-    error_text = response.text.lower()
-    token_limit_keywords = ['token', 'limit', 'exceed', 'invalidargument', 'resourceexhausted', 'too large', 'context length']
-    return any(keyword in error_text for keyword in token_limit_keywords)
+    return bool(TOKEN_LIMIT_RE.search(error_snippet(response)))
 
 
 def is_rate_limit_error(response: requests.Response) -> bool:
     """Check if the error is a rate limit (429) error."""
     if response.status_code == 429:
         return True
-    error_text = response.text.lower()
-    rate_limit_keywords = ['too many requests', 'rate limit', 'quota', '429', 'resource exhausted']
-    return any(keyword in error_text for keyword in rate_limit_keywords)
+    return bool(RATE_LIMIT_RE.search(error_snippet(response)))
+
+
+# Edge Function token bucket, shared by all threads: refills one call per
+# API_DELAY and holds up to API_BURST, so idle time buys back-to-back calls
+api_tokens = float(API_BURST)
+api_tokens_at = time.monotonic()
+api_pacing_lock = threading.Lock()
+
+
+def wait_for_api_slot() -> None:
+    """Reserve an Edge Function call slot, sleeping only until the bucket has a token."""
+    global api_tokens, api_tokens_at
+    with api_pacing_lock:
+        now = time.monotonic()
+        api_tokens = min(API_BURST, api_tokens + (now - api_tokens_at) / API_DELAY)
+        api_tokens_at = now
+        api_tokens -= 1  # May go negative - later callers queue up behind this one
+        wait_time = -api_tokens * API_DELAY if api_tokens < 0 else 0.0
+    if wait_time > 0:
+        time.sleep(wait_time)
+
+
+# Edge Function circuit breaker, shared by all threads: after repeated
+# 429/5xx/timeouts every section call fails fast for BREAKER_COOLDOWN seconds
+section_failures = 0
+circuit_open_until = 0.0
+circuit_lock = threading.Lock()
+
+
+def circuit_is_open() -> bool:
+    """True while section calls should fail fast."""
+    with circuit_lock:
+        return time.monotonic() < circuit_open_until
+
+
+def record_section_success() -> None:
+    """Reset the consecutive-failure count."""
+    global section_failures
+    with circuit_lock:
+        section_failures = 0
+
+
+def record_section_failure() -> None:
+    """Count a failed Edge Function attempt, opening the circuit at the threshold."""
+    global section_failures, circuit_open_until
+    with circuit_lock:
+        section_failures += 1
+        if section_failures < BREAKER_FAILURE_THRESHOLD:
+            return
+        section_failures = 0
+        circuit_open_until = time.monotonic() + BREAKER_COOLDOWN
+    logger.error(
+        f"🛑 {BREAKER_FAILURE_THRESHOLD} consecutive Edge Function failures - "
+        f"failing section calls fast for {BREAKER_COOLDOWN}s"
+    )
+
+
+def create_context_cache(file_uris: list[str], display_name: str) -> Optional[str]:
+    """Create a Gemini context cache over the given uploaded PDFs; returns its name or None."""
+    parts = [
+        genai.protos.Part(
+            file_data=genai.protos.FileData(mime_type="application/pdf", file_uri=uri)
+        )
+        for uri in file_uris if uri
+    ]
+
+    try:
+        cache = genai.caching.CachedContent.create(
+            model=f"models/{MODEL_NAME}",
+            display_name=display_name,
+            contents=[{"role": "user", "parts": parts}],
+            ttl=datetime.timedelta(minutes=CONTEXT_CACHE_TTL_MINUTES)
+        )
+        logger.info(f"Created context cache for {display_name}: {cache.name}")
+        return cache.name
+    except Exception as e:
+        logger.warning(f"Could not create context cache for {display_name}: {e}")
+        return None
+
+
+def delete_context_cache(cache_name: str) -> None:
+    """Delete a Gemini context cache, ignoring errors (it expires anyway)."""
+    try:
+        genai.caching.CachedContent(cache_name).delete()
+    except Exception as e:
+        logger.warning(f"Could not delete context cache {cache_name}: {e}")
 
 
 def call_section_api(
@@ -688,7 +1134,8 @@ def call_section_api(
     file_uri1: str,
     file_uri2: Optional[str],
     company_name: str,
-    display_name: str
+    display_name: str,
+    cached_content_name: Optional[str] = None
 ) -> tuple[Optional[str], bool]:
     """
     Make API call to generate a section with exponential backoff retry.
@@ -702,38 +1149,53 @@ def call_section_api(
         "companyName": company_name,
         "model": MODEL_NAME
     }
+    if cached_content_name:
+        payload["cachedContentName"] = cached_content_name
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {SUPABASE_ANON_KEY}"
-    }
+    # Stable across retries, so the Edge Function can dedupe a retried request
+    # whose first attempt succeeded but whose response was lost
+    idempotency_key = hashlib.sha256(
+        f"{section_id}|{file_uri1}|{file_uri2}|{company_name}|{MODEL_NAME}".encode("utf-8")
+    ).hexdigest()
 
     rate_limit_retries = 0
     general_retries = 0
     max_general_retries = 3
 
-    while True:
+    # Bounded by the two retry budgets - guarantees termination if a branch forgets to count
+    for _ in range(MAX_RETRIES + max_general_retries):
+        if circuit_is_open():
+            logger.error(f"Edge Function circuit open - skipping {display_name}")
+            return None, False
+
         try:
-            response = requests.post(
+            wait_for_api_slot()
+            response = http_session.post(
                 SUPABASE_FUNCTION_URL,
                 json=payload,
-                headers=headers,
+                headers={"Idempotency-Key": idempotency_key},
                 timeout=300  # 5 minute timeout for heavy operations
             )
 
             if response.status_code == 200:
-                data = response.json()
-                html_content = data.get("html", data.get("content", ""))
+                record_section_success()
+                data = json_loads(response.content)
+                html_content = data.get("html") or data.get("content") or ""
                 if html_content:
                     return html_content, False
                 else:
                     return None, False
 
-            # Rate limit - exponential backoff
+            # Rate limit - honor Retry-After when present, else exponential backoff
             if is_rate_limit_error(response):
+                record_section_failure()
                 rate_limit_retries += 1
                 if rate_limit_retries <= MAX_RETRIES:
-                    wait_time = min(BASE_DELAY * (2 ** (rate_limit_retries - 1)), MAX_DELAY)
+                    retry_after = retry_after_seconds(response)
+                    wait_time = (
+                        backoff_delay(retry_after, 0) if retry_after is not None
+                        else backoff_delay(BASE_DELAY, rate_limit_retries - 1)
+                    )
                     logger.warning(f"⏳ Rate limit hit for {display_name}. Waiting {wait_time}s before retry {rate_limit_retries}/{MAX_RETRIES}...")
                     time.sleep(wait_time)
                     continue
@@ -745,12 +1207,19 @@ def call_section_api(
             if is_token_limit_error(response):
                 return None, True
 
-            # Other 500 errors
-            if response.status_code == 500:
+            if response.status_code >= 500:
+                record_section_failure()
+
+            # Other transient server errors - a 503 usually says when to come back
+            if response.status_code in RETRYABLE_STATUS_CODES:
                 general_retries += 1
                 if general_retries < max_general_retries:
-                    wait_time = 10 * general_retries
-                    logger.warning(f"Attempt {general_retries} failed for {display_name} (500 error), retrying in {wait_time}s...")
+                    retry_after = retry_after_seconds(response)
+                    wait_time = (
+                        backoff_delay(retry_after, 0) if retry_after is not None
+                        else 10 * general_retries
+                    )
+                    logger.warning(f"Attempt {general_retries} failed for {display_name} ({response.status_code} error), retrying in {wait_time}s...")
                     time.sleep(wait_time)
                     continue
                 else:
@@ -761,6 +1230,7 @@ def call_section_api(
             return None, False
 
         except requests.exceptions.Timeout:
+            record_section_failure()
             general_retries += 1
             if general_retries < max_general_retries:
                 logger.warning(f"Timeout on attempt {general_retries} for {display_name}, retrying...")
@@ -772,40 +1242,48 @@ def call_section_api(
             logger.error(f"Exception generating {display_name}: {e}")
             return None, False
 
+    logger.error(f"Retry budget exhausted for {display_name}")
+    return None, False
+
+
+def section_ok(section_html: str) -> bool:
+    """True for a generated section (prefix check - model output may contain class="error")."""
+    return section_html.startswith('<div class="section" id="')
+
 
 def generate_section_with_fallback(
     section_id: str,
     primary_uri: str,
     secondary_uri: Optional[str],
     fallback_uri: str,
-    company_name: str
+    company_name: str,
+    skip_phase1: bool = False,
+    cached_content_name: Optional[str] = None
 ) -> str:
-    """Generate a report section with smart fallback for token limit errors."""
-    section_display_names = {
-        'company_profile': 'פרופיל חברה',
-        'executive_summary': 'תקציר מנהלים',
-        'business_environment': 'סביבה עסקית',
-        'asset_portfolio_analysis': 'ניתוח תיק נכסים',
-        'debt_structure': 'מבנה חוב',
-        'financial_analysis': 'ניתוח פיננסי',
-        'cash_flow_and_liquidity': 'תזרים מזומנים ונזילות',
-        'liquidation_analysis': 'ניתוח פירוק'
-    }
-
-    display_name = section_display_names.get(section_id, section_id)
+    """
+    Generate a report section with smart fallback for token limit errors.
+    With skip_phase1 (inputs known to be too large) go straight to the fallback file.
+    cached_content_name (context cache of primary + secondary) is used in Phase 1 only.
+    """
+    display_name = SECTION_DISPLAY_NAMES.get(section_id, section_id)
     logger.info(f"  Generating: {display_name} ({section_id})...")
 
-    # Phase 1: Try with primary + secondary files
-    files_desc = "primary + secondary" if secondary_uri else "primary only"
-    logger.info(f"    Phase 1: Attempting with {files_desc}...")
-
-    html_content, is_token_error = call_section_api(
-        section_id, primary_uri, secondary_uri, company_name, display_name
-    )
+    if skip_phase1 and secondary_uri:
+        logger.warning("    ⚠️ Inputs exceed token budget - skipping Phase 1")
+        html_content, is_token_error = None, True
+    else:
+        # Phase 1: Try with primary + secondary files
+        files_desc = "primary + secondary" if secondary_uri else "primary only"
+        logger.info(f"    Phase 1: Attempting with {files_desc}...")
+
+        html_content, is_token_error = call_section_api(
+            section_id, primary_uri, secondary_uri, company_name, display_name,
+            cached_content_name
+        )
 
-    if html_content:
-        logger.info(f"    ✓ Successfully generated {display_name}")
-        return f'<div class="section" id="{section_id}">\n{html_content}\n</div>'
+        if html_content:
+            logger.info(f"    ✓ Successfully generated {display_name}")
+            return f'<div class="section" id="{section_id}">\n{html_content}\n</div>'
 
     # Phase 2: Fallback to single file if token limit error
     if is_token_error:
@@ -834,18 +1312,45 @@ def generate_section_with_fallback(
 # MAIN PROCESSING LOGIC
 # ============================================================
 
-def process_company(company_dir: Path, model: genai.GenerativeModel) -> tuple[bool, list[str]]:
+def is_report_complete(html_path: Path) -> bool:
+    """Check whether a saved HTML report contains every section."""
+    try:
+        report_html = html_path.read_text(encoding='utf-8')
+    except OSError:
+        return False
+    return set(SECTION_ID_RE.findall(report_html)) >= set(SECTIONS)
+
+
+def process_company(
+    company_dir: Path,
+    model: genai.GenerativeModel,
+    force: bool = False
+) -> tuple[bool, list[str]]:
     """
     Process a single company using Smart Threshold & Dynamic Mapping Strategy.
-    Uses gemini-3-pro-preview for ALL AI operations.
+    Structure mapping runs on the given (Flash) model; sections run on gemini-3-pro-preview.
+    Skips companies whose report is already complete unless force is set.
     """
     company_name = company_dir.name
     failed_sections = []
-    temp_files = []
+    partial_file = None
+
+    # One call, so the banner stays together when companies run concurrently
+    logger.info(f"\n{SEPARATOR}\nProcessing company: {company_name}\n{SEPARATOR}")
+
+    # Generate filename with company name and date
+    output_company_dir = OUTPUT_DIR / company_name
+    display_name = company_name.replace('_', ' ')
+    month_idx = int(time.strftime('%m')) - 1
+    year = time.strftime('%Y')
+    timestamp = f"{HEBREW_MONTHS[month_idx]} {year}"
+    report_filename = f"{display_name} דוח אנליזה - {timestamp}"
 
-    logger.info(f"\n{'='*60}")
-    logger.info(f"Processing company: {company_name}")
-    logger.info(f"{'='*60}")
+    output_file = output_company_dir / f"{report_filename}.html"
+
+    if not force and is_report_complete(output_file):
+        logger.info("✅ Complete report already exists, skipping (use --force to regenerate)")
+        return True, []
 
     try:
         # Step 1: Find PDF files
@@ -858,119 +1363,158 @@ def process_company(company_dir: Path, model: genai.GenerativeModel) -> tuple[bo
         logger.info(f"Found PDFs - Annual: {annual_pdf.name if annual_pdf else 'None'}, "
                     f"Quarterly: {quarterly_pdf.name if quarterly_pdf else 'None'}")
 
-        # Step 2: Threshold Check
-        is_heavy, total_pages = is_heavy_report(annual_pdf)
-
-        board_slice_path = None
-        financial_slice_path = None
+        board_slice = None
+        financial_slice = None
 
-        if is_heavy:
-            logger.warning(f"⚠️  HEAVY REPORT DETECTED ({total_pages} pages > {HEAVY_REPORT_THRESHOLD})")
-            logger.info("Engaging Smart Mapping Strategy with gemini-3-pro-preview...")
+        # Step 2: Threshold Check - the annual PDF is opened once for counting, mapping and slicing
+        with opened_pdf(annual_pdf) as annual_doc:
+            total_pages = annual_doc.page_count if annual_doc is not None else 0
+            is_heavy = total_pages > HEAVY_REPORT_THRESHOLD
 
-            # A. Run AI-powered structure mapper (uses gemini-3-pro-preview with retry)
-            structure_map = map_report_structure(annual_pdf, model)
+            if is_heavy:
+                logger.warning(f"⚠️  HEAVY REPORT DETECTED ({total_pages} pages > {HEAVY_REPORT_THRESHOLD})")
+                logger.info(f"Engaging Smart Mapping Strategy with {STRUCTURE_MODEL_NAME}...")
 
-            # B. Create targeted slices
-            logger.info("Step 2b: Creating targeted PDF slices...")
-            slices = create_report_slices(annual_pdf, structure_map, company_dir)
+                # A. Run AI-powered structure mapper (uses the Flash model with retry)
+                structure_map = map_report_structure(annual_pdf, model, annual_doc)
 
-            board_slice_path = slices.get('board_slice')
-            financial_slice_path = slices.get('financial_slice')
+                # B. Create targeted slices
+                logger.info("Step 2b: Creating targeted PDF slices...")
+                slices = create_report_slices(annual_pdf, structure_map, annual_doc)
 
-            if board_slice_path:
-                temp_files.append(board_slice_path)
-            if financial_slice_path:
-                temp_files.append(financial_slice_path)
+                board_slice = slices.get('board_slice')
+                financial_slice = slices.get('financial_slice')
 
-            if not board_slice_path and not financial_slice_path:
-                logger.warning("Could not create slices, falling back to standard processing")
-                is_heavy = False
-        else:
-            logger.info(f"✅ Standard Report ({total_pages} pages). Using standard processing.")
+                if not board_slice and not financial_slice:
+                    logger.warning("Could not create slices, falling back to standard processing")
+                    is_heavy = False
+            else:
+                logger.info(f"✅ Standard Report ({total_pages} pages). Using standard processing.")
 
         # Step 3: Upload PDFs to Gemini
         logger.info("Step 3: Uploading PDFs to Gemini...")
 
-        full_annual_uri = None
-        board_slice_uri = None
-        financial_slice_uri = None
-        quarterly_uri = None
-
+        # Collect every file this company needs and upload them concurrently
+        upload_jobs = {}
         if is_heavy:
-            if board_slice_path:
-                board_slice_uri = upload_pdf_to_gemini(board_slice_path)
-            if financial_slice_path:
-                financial_slice_uri = upload_pdf_to_gemini(financial_slice_path)
-
-            if board_slice_uri is None and financial_slice_uri is None:
-                logger.error(f"Failed to upload any slices for {company_name}")
-                return False, ["UPLOAD_FAILED"]
+            if board_slice:
+                upload_jobs['board'] = (board_slice, f"slice_board_{annual_pdf.stem}.pdf")
+            if financial_slice:
+                upload_jobs['financial'] = (financial_slice, f"slice_financial_{annual_pdf.stem}.pdf")
         else:
-            full_annual_uri = upload_pdf_to_gemini(annual_pdf)
-            if full_annual_uri is None:
-                logger.error(f"Failed to upload annual report for {company_name}")
-                return False, ["UPLOAD_FAILED"]
-
+            upload_jobs['annual'] = (annual_pdf, None)
         if quarterly_pdf:
-            quarterly_uri = upload_pdf_to_gemini(quarterly_pdf)
-
-        # Step 4: Generate sections
-        logger.info("Step 4: Generating sections...")
-        html_sections = []
-
-        for section_id in SECTIONS:
-            if is_heavy:
-                if section_id in BOARD_REPORT_SECTIONS:
-                    primary_uri = board_slice_uri or financial_slice_uri
-                    logger.info(f"[Heavy → Board Slice] {section_id}")
-                else:
-                    primary_uri = financial_slice_uri or board_slice_uri
-                    logger.info(f"[Heavy → Financial Slice] {section_id}")
-
-                section_html = generate_section_with_fallback(
-                    section_id=section_id,
-                    primary_uri=primary_uri,
-                    secondary_uri=quarterly_uri,
-                    fallback_uri=primary_uri,
-                    company_name=company_name
-                )
-            else:
-                logger.info(f"[Standard] {section_id}")
-                section_html = generate_section_with_fallback(
-                    section_id=section_id,
-                    primary_uri=full_annual_uri,
-                    secondary_uri=quarterly_uri,
-                    fallback_uri=full_annual_uri,
-                    company_name=company_name
-                )
-
-            html_sections.append(section_html)
-
-            if 'class="error"' in section_html:
-                failed_sections.append(section_id)
+            upload_jobs['quarterly'] = (quarterly_pdf, None)
 
-            time.sleep(API_DELAY)
+        with ThreadPoolExecutor(max_workers=len(upload_jobs)) as executor:
+            upload_futures = {
+                tag: executor.submit(upload_pdf_to_gemini, pdf, name)
+                for tag, (pdf, name) in upload_jobs.items()
+            }
+            uris = {tag: future.result() for tag, future in upload_futures.items()}
 
-        # Step 5: Assemble and save HTML
-        final_html = get_html_template(company_name)
-        final_html += "\n".join(html_sections)
-        final_html += get_html_footer()
+        full_annual_uri = uris.get('annual')
+        board_slice_uri = uris.get('board')
+        financial_slice_uri = uris.get('financial')
+        quarterly_uri = uris.get('quarterly')
 
-        output_company_dir = OUTPUT_DIR / company_name
+        if is_heavy:
+            if board_slice_uri is None and financial_slice_uri is None:
+                logger.error(f"Failed to upload any slices for {company_name}")
+                return False, ["UPLOAD_FAILED"]
+        elif full_annual_uri is None:
+            logger.error(f"Failed to upload annual report for {company_name}")
+            return False, ["UPLOAD_FAILED"]
+
+        # Page counts per uploaded file, for the Phase 1 token preflight
+        page_counts = {}
+        if full_annual_uri:
+            page_counts[full_annual_uri] = total_pages
+        if board_slice_uri:
+            page_counts[board_slice_uri] = get_pdf_bytes_page_count(board_slice)
+        if financial_slice_uri:
+            page_counts[financial_slice_uri] = get_pdf_bytes_page_count(financial_slice)
+        quarterly_pages = get_pdf_page_count(quarterly_pdf) if quarterly_uri else 0
+
+        def over_budget(uri: str) -> bool:
+            pages = page_counts.get(uri, 0) + quarterly_pages
+            return pages * ESTIMATED_TOKENS_PER_PAGE > PHASE1_TOKEN_BUDGET
+
+        # Step 4: Generate sections, streaming each one to disk as it arrives
         output_company_dir.mkdir(parents=True, exist_ok=True)
 
-        # Generate filename with company name and date
-        display_name = company_name.replace('_', ' ')
-        month_idx = int(time.strftime('%m')) - 1
-        year = time.strftime('%Y')
-        timestamp = f"{HEBREW_MONTHS[month_idx]} {year}"
-        report_filename = f"{display_name} דוח אנליזה - {timestamp}"
+        # Write to a .part file and rename at the end, so an interrupted run
+        # never leaves a truncated report under the final name
+        partial_file = output_file.with_name(output_file.name + ".part")
 
-        output_file = output_company_dir / f"{report_filename}.html"
+        logger.info("Step 4: Generating sections...")
 
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(final_html)
+        with open(partial_file, 'w', encoding='utf-8', buffering=1 << 20) as report:
+            report.write(_HTML_PREFIX)
+            report.write(get_html_template(company_name))
+
+            # Route each section to its primary file
+            section_uris = {}
+            board_primary_uri = board_slice_uri or financial_slice_uri
+            financial_primary_uri = financial_slice_uri or board_slice_uri
+            for section_id in SECTIONS:
+                if is_heavy:
+                    if section_id in BOARD_REPORT_SECTIONS:
+                        section_uris[section_id] = board_primary_uri
+                        logger.info(f"[Heavy → Board Slice] {section_id}")
+                    else:
+                        section_uris[section_id] = financial_primary_uri
+                        logger.info(f"[Heavy → Financial Slice] {section_id}")
+                else:
+                    section_uris[section_id] = full_annual_uri
+                    logger.info(f"[Standard] {section_id}")
+
+            # One context cache per distinct primary file (+ quarterly), shared by
+            # its sections; skipped where Phase 1 is skipped and it would go unused
+            cache_names = {}
+            if ENABLE_CONTEXT_CACHE:
+                for primary_uri in dict.fromkeys(section_uris.values()):
+                    if not over_budget(primary_uri):
+                        cache_name = create_context_cache(
+                            [primary_uri, quarterly_uri],
+                            f"{company_name} ({len(cache_names) + 1})"
+                        )
+                        if cache_name:
+                            cache_names[primary_uri] = cache_name
+
+            # Sections are independent network calls - run them concurrently
+            # (paced by wait_for_api_slot) and write them out in report order
+            try:
+                with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_SECTIONS) as executor:
+                    section_futures = {
+                        section_id: executor.submit(
+                            generate_section_with_fallback,
+                            section_id=section_id,
+                            primary_uri=primary_uri,
+                            secondary_uri=quarterly_uri,
+                            fallback_uri=primary_uri,
+                            company_name=company_name,
+                            skip_phase1=over_budget(primary_uri),
+                            cached_content_name=cache_names.get(primary_uri)
+                        )
+                        for section_id, primary_uri in section_uris.items()
+                    }
+
+                    for section_id, future in section_futures.items():
+                        section_html = future.result()
+                        report.write(section_html)
+                        report.write("\n")
+
+                        if not section_ok(section_html):
+                            failed_sections.append(section_id)
+            finally:
+                for cache_name in cache_names.values():
+                    delete_context_cache(cache_name)
+
+            report.write(_HTML_FOOTER)
+
+        # Step 5: Publish the finished report
+        os.replace(partial_file, output_file)
 
         logger.info(f"Report saved to: {output_file}")
 
@@ -981,20 +1525,32 @@ def process_company(company_dir: Path, model: genai.GenerativeModel) -> tuple[bo
         return True, []
 
     finally:
-        for temp_file in temp_files:
-            if temp_file and temp_file.exists():
-                try:
-                    temp_file.unlink()
-                except Exception as e:
-                    logger.warning(f"Could not delete temporary file {temp_file}: {e}")
+        # Only left behind if the report was not published
+        if partial_file is not None and partial_file.exists():
+            try:
+                partial_file.unlink()
+            except Exception as e:
+                logger.warning(f"Could not delete temporary file {partial_file}: {e}")
 
 
 def main():
     """Main entry point for batch report generation."""
-    logger.info("=" * 60)
+    parser = argparse.ArgumentParser(description="Generate financial analysis reports")
+    parser.add_argument(
+        "company_filter", nargs="?",
+        help="Process only companies whose folder name contains this text"
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Regenerate reports that are already complete"
+    )
+    args = parser.parse_args()
+    company_filter = args.company_filter
+
+    logger.info(SEPARATOR)
     logger.info("Starting Batch Financial Report Generator")
-    logger.info(f"Model: {MODEL_NAME} (single model for all operations)")
-    logger.info("=" * 60)
+    logger.info(f"Model: {MODEL_NAME} (sections), {STRUCTURE_MODEL_NAME} (structure mapping)")
+    logger.info(SEPARATOR)
 
     if not SUPABASE_ANON_KEY:
         logger.error("SUPABASE_ANON_KEY environment variable is not set")
@@ -1004,9 +1560,10 @@ def main():
         logger.error("GOOGLE_API_KEY environment variable is not set")
         return
 
-    # Configure Gemini and get model instance
+    # Configure Gemini - only structure mapping calls a model directly from here
     try:
-        model = configure_gemini()
+        configure_gemini()
+        model = structure_model
     except Exception as e:
         logger.error(f"Failed to configure Gemini: {e}")
         return
@@ -1017,14 +1574,16 @@ def main():
 
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-    company_dirs = [d for d in FINANCIAL_REPORTS_DIR.iterdir() if d.is_dir()]
+    # DirEntry.is_dir uses the type readdir already returned - no stat per entry
+    with os.scandir(FINANCIAL_REPORTS_DIR) as it:
+        company_dirs = [Path(entry.path) for entry in it if entry.is_dir()]
 
-    if COMPANY_FILTER:
-        company_dirs = [d for d in company_dirs if COMPANY_FILTER in d.name]
+    if company_filter:
+        company_dirs = [d for d in company_dirs if company_filter in d.name]
         if not company_dirs:
-            logger.error(f"No company folder matching '{COMPANY_FILTER}' found")
+            logger.error(f"No company folder matching '{company_filter}' found")
             return
-        logger.info(f"Filtered to companies matching: {COMPANY_FILTER}")
+        logger.info(f"Filtered to companies matching: {company_filter}")
 
     if not company_dirs:
         logger.error("No company folders found in Financial_Reports directory")
@@ -1037,26 +1596,36 @@ def main():
     total_failed = 0
     all_failures = {}
 
-    for company_dir in sorted(company_dirs):
-        try:
-            success, failed_sections = process_company(company_dir, model)
-            if success:
-                fully_successful += 1
-            elif failed_sections and failed_sections[0] not in ["NO_FILES", "UPLOAD_FAILED"]:
-                partial_success += 1
-                all_failures[company_dir.name] = failed_sections
-            else:
+    # Companies are independent and I/O bound - process them concurrently.
+    # Results are collected here on the main thread, so the counters need no lock.
+    # Tally each company as soon as it finishes rather than in submission order
+    with ThreadPoolExecutor(max_workers=min(MAX_CONCURRENT_COMPANIES, len(company_dirs))) as executor:
+        futures = {
+            executor.submit(process_company, company_dir, model, args.force): company_dir
+            for company_dir in sorted(company_dirs)
+        }
+
+        for future in as_completed(futures):
+            company_dir = futures[future]
+            try:
+                success, failed_sections = future.result()
+                if success:
+                    fully_successful += 1
+                elif failed_sections and failed_sections[0] not in ["NO_FILES", "UPLOAD_FAILED"]:
+                    partial_success += 1
+                    all_failures[company_dir.name] = failed_sections
+                else:
+                    total_failed += 1
+                    all_failures[company_dir.name] = failed_sections
+            except Exception as e:
+                logger.error(f"Unexpected error processing {company_dir.name}: {e}")
                 total_failed += 1
-                all_failures[company_dir.name] = failed_sections
-        except Exception as e:
-            logger.error(f"Unexpected error processing {company_dir.name}: {e}")
-            total_failed += 1
-            all_failures[company_dir.name] = ["EXCEPTION"]
+                all_failures[company_dir.name] = ["EXCEPTION"]
 
     # Summary
-    logger.info("\n" + "=" * 60)
+    logger.info("\n" + SEPARATOR)
     logger.info("BATCH PROCESSING COMPLETE")
-    logger.info("=" * 60)
+    logger.info(SEPARATOR)
     logger.info(f"Fully successful (all sections): {fully_successful}")
     logger.info(f"Partial success (some sections failed): {partial_success}")
     logger.info(f"Failed (no report generated): {total_failed}")
@@ -1064,14 +1633,13 @@ def main():
     logger.info(f"Reports saved to: {OUTPUT_DIR}")
 
     if all_failures:
-        logger.error("\n" + "=" * 60)
-        logger.error("⚠️  FAILURES REPORT - ACTION REQUIRED")
-        logger.error("=" * 60)
-        for company, sections in all_failures.items():
-            logger.error(f"  {company}:")
-            for section in sections:
-                logger.error(f"    - {section}")
-        logger.error("=" * 60)
+        # Build the whole report first and emit it with a single logging call
+        report_lines = ["", SEPARATOR, "⚠️  FAILURES REPORT - ACTION REQUIRED", SEPARATOR]
+        for company, sections in sorted(all_failures.items()):
+            report_lines.append(f"  {company}:")
+            report_lines.extend(f"    - {section}" for section in sections)
+        report_lines.append(SEPARATOR)
+        logger.error("\n".join(report_lines))
 
 
 if __name__ == "__main__":
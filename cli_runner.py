@@ -9,17 +9,22 @@ This is THE LOCAL BOSS - handles all file system operations:
 - Saving HTML reports to disk
 
 Usage:
-    python cli_runner.py [company_filter]
+    python cli_runner.py [company_filter] [--force]
 
 Examples:
     python cli_runner.py                    # Process all companies
     python cli_runner.py "Company Name"     # Process only matching companies
+    python cli_runner.py --force            # Regenerate reports that are already complete
+                                            # (ignores cached sections; fresh ones are re-cached)
 """
 
 import os
-import sys
+import re
 import time
+import argparse
 import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import Optional
 
@@ -28,21 +33,34 @@ from core import (
     # Config
     SECTIONS,
     BOARD_REPORT_SECTIONS,
-    API_DELAY,
+    MAX_CONCURRENT_COMPANIES,
+    MAX_PDF_WORKERS,
     DEFAULT_FINANCIAL_REPORTS_DIR,
     DEFAULT_OUTPUT_DIR,
+    DEFAULT_CACHE_DIR,
+    MAX_CACHE_BYTES,
     MODEL_NAME,
+    STRUCTURE_MODEL_NAME,
     HEAVY_REPORT_THRESHOLD,
     GOOGLE_API_KEY,
     validate_config,
+    # Cache
+    DiskCache,
+    sha1_bytes,
+    make_key,
     # AI Engine
     configure_gemini,
-    upload_pdf_to_gemini,
-    generate_section_with_fallback,
+    get_structure_model,
+    upload_pdfs_to_gemini,
+    generate_sections,
+    is_section_ok,
     # PDF Processor
     is_heavy_report,
+    get_pdf_page_count,
     map_report_structure,
     create_report_slices,
+    shared_pdf_buffer,
+    create_report_slices_from_shm,
     # Report Builder
     HEBREW_MONTHS,
     assemble_report,
@@ -61,11 +79,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Banner line used in log output
+SEPARATOR = "=" * 60
+
 
 # =============================================================================
 # FILE SYSTEM OPERATIONS (CLI-SPECIFIC)
 # =============================================================================
 
+# Filename keywords used to classify a company's PDFs
+ANNUAL_KEYWORDS = ("annual", "שנתי")
+QUARTERLY_KEYWORDS = ("quarter", "רבעוני", "q1", "q2", "q3", "q4")
+ANNUAL_RE = re.compile("|".join(map(re.escape, ANNUAL_KEYWORDS)), re.IGNORECASE)
+QUARTERLY_RE = re.compile("|".join(map(re.escape, QUARTERLY_KEYWORDS)), re.IGNORECASE)
+
+# Successfully generated sections are wrapped in <div class="section" id="...">
+SECTION_ID_RE = re.compile(r'<div class="section" id="([^"]+)"')
+
+
 def find_pdf_files(company_dir: Path) -> tuple[Optional[Path], Optional[Path]]:
     """
     Find Annual and Quarterly PDF files in a company directory.
@@ -78,23 +109,30 @@ def find_pdf_files(company_dir: Path) -> tuple[Optional[Path], Optional[Path]]:
     """
     annual_pdf = None
     quarterly_pdf = None
-
-    for file in company_dir.glob("*.pdf"):
-        filename = file.name.lower()
-        if "annual" in filename or "שנתי" in filename:
-            annual_pdf = file
-        elif any(q in filename for q in ["quarter", "רבעוני", "q1", "q2", "q3", "q4"]):
-            quarterly_pdf = file
+    pdfs = []
+
+    # Single directory pass: collect PDFs and classify them by name
+    with os.scandir(company_dir) as it:
+        for entry in it:
+            if entry.name.startswith('.') or not entry.name.lower().endswith('.pdf'):
+                continue
+            pdfs.append(entry.name)
+            if ANNUAL_RE.search(entry.name):
+                annual_pdf = entry.name
+            elif QUARTERLY_RE.search(entry.name):
+                quarterly_pdf = entry.name
 
     # Fallback: use first PDF as annual, second as quarterly
-    if annual_pdf is None:
-        pdfs = sorted(company_dir.glob("*.pdf"))
-        if pdfs:
-            annual_pdf = pdfs[0]
-            if len(pdfs) > 1:
-                quarterly_pdf = pdfs[1]
+    if annual_pdf is None and pdfs:
+        pdfs.sort()
+        annual_pdf = pdfs[0]
+        if len(pdfs) > 1:
+            quarterly_pdf = pdfs[1]
 
-    return annual_pdf, quarterly_pdf
+    return (
+        company_dir / annual_pdf if annual_pdf else None,
+        company_dir / quarterly_pdf if quarterly_pdf else None
+    )
 
 
 def read_pdf_bytes(pdf_path: Path) -> Optional[bytes]:
@@ -128,8 +166,8 @@ def save_html_report(html_content: str, output_path: Path) -> bool:
     """
     try:
         output_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(html_content)
+        # Encode once and write in one call rather than through a text-mode wrapper
+        output_path.write_bytes(html_content.encode('utf-8'))
         return True
     except Exception as e:
         logger.error(f"Error saving report to {output_path}: {e}")
@@ -149,19 +187,57 @@ def save_pdf_report(pdf_bytes: bytes, output_path: Path) -> bool:
     """
     try:
         output_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(output_path, 'wb') as f:
-            f.write(pdf_bytes)
+        output_path.write_bytes(pdf_bytes)
         return True
     except Exception as e:
         logger.error(f"Error saving PDF to {output_path}: {e}")
         return False
 
 
+def get_report_base_path(company_name: str) -> Path:
+    """
+    Build the output path (without extension) for a company's report.
+
+    Args:
+        company_name: Name of the company
+
+    Returns:
+        Path of the report inside the company's output directory
+    """
+    display_name = company_name.replace('_', ' ')
+    month_idx = int(time.strftime('%m')) - 1
+    year = time.strftime('%Y')
+    timestamp = f"{HEBREW_MONTHS[month_idx]} {year}"
+    return DEFAULT_OUTPUT_DIR / company_name / f"{display_name} דוח אנליזה - {timestamp}"
+
+
+def is_report_complete(html_path: Path) -> bool:
+    """
+    Check whether a saved HTML report contains every section.
+
+    Args:
+        html_path: Path to the HTML report
+
+    Returns:
+        True if the file exists and all sections were generated successfully
+    """
+    try:
+        html = html_path.read_text(encoding='utf-8')
+    except OSError:
+        return False
+    return set(SECTION_ID_RE.findall(html)) >= set(SECTIONS)
+
+
 # =============================================================================
 # COMPANY PROCESSING (ORCHESTRATION)
 # =============================================================================
 
-def process_company(company_dir: Path, model) -> tuple[bool, list[str]]:
+def process_company(
+    company_dir: Path,
+    model,
+    force: bool = False,
+    pdf_pool: Optional[Executor] = None
+) -> tuple[bool, list[str]]:
     """
     Process a single company using Smart Threshold & Dynamic Mapping Strategy.
 
@@ -173,9 +249,16 @@ def process_company(company_dir: Path, model) -> tuple[bool, list[str]]:
     5. Generate all 8 sections
     6. Assemble and save HTML report
 
+    Sections are looked up in the section cache first; steps 2-4 are skipped
+    when all of them are cached (the holding chart is still extracted).
+
     Args:
         company_dir: Path to the company directory
-        model: Configured Gemini model instance
+        model: Gemini model used for structure mapping
+        force: Regenerate the report even if a complete one already exists; cached
+            sections are not read (fresh results are still written to the cache)
+        pdf_pool: Process pool for PDF slicing (PyMuPDF holds the GIL, so slicing
+            in this thread would stall the other companies); sliced inline if None
 
     Returns:
         Tuple of (success, list_of_failed_sections)
@@ -184,9 +267,16 @@ def process_company(company_dir: Path, model) -> tuple[bool, list[str]]:
     failed_sections = []
     temp_slice_bytes = {}  # Store slice bytes for cleanup tracking
 
-    logger.info(f"\n{'='*60}")
-    logger.info(f"Processing company: {company_name}")
-    logger.info(f"{'='*60}")
+    # One call, so the banner stays together when companies run concurrently
+    logger.info(f"\n{SEPARATOR}\nProcessing company: {company_name}\n{SEPARATOR}")
+
+    report_base_path = get_report_base_path(company_name)
+    html_output_file = report_base_path.with_name(report_base_path.name + ".html")
+    pdf_output_file = report_base_path.with_name(report_base_path.name + ".pdf")
+
+    if not force and is_report_complete(html_output_file):
+        logger.info("✅ Complete report already exists, skipping (use --force to regenerate)")
+        return True, []
 
     try:
         # Step 1: Find PDF files
@@ -211,69 +301,112 @@ def process_company(company_dir: Path, model) -> tuple[bool, list[str]]:
         if quarterly_pdf:
             quarterly_bytes = read_pdf_bytes(quarterly_pdf)
 
-        # Step 2: Threshold Check
-        is_heavy, total_pages = is_heavy_report(annual_bytes)
+        # Sections are cached by content, so re-runs only regenerate failed ones
+        section_cache = DiskCache(DEFAULT_CACHE_DIR / "sections", max_bytes=MAX_CACHE_BYTES)
+        annual_hash = sha1_bytes(annual_bytes)
+        quarterly_hash = sha1_bytes(quarterly_bytes) if quarterly_bytes else ""
+        section_keys = {
+            section_id: make_key(section_id, MODEL_NAME, annual_hash, quarterly_hash)
+            for section_id in SECTIONS
+        }
+
+        # Look the sections up first - when all are cached, slicing and uploads
+        # (and the per-file Gemini processing) can be skipped entirely
+        section_results = {}
+        if not force:
+            for section_id in SECTIONS:
+                cached_html = section_cache.get(section_keys[section_id])
+                if cached_html is not None:
+                    logger.info(f"[Cached] {section_id}")
+                    section_results[section_id] = cached_html.decode('utf-8')
+
+        upload_jobs = {}
+        if len(section_results) == len(SECTIONS):
+            logger.info("✅ All sections cached - skipping slicing and uploads")
+        else:
+            # Step 2: Threshold Check
+            is_heavy, total_pages = is_heavy_report(annual_bytes)
 
-        board_slice_bytes = None
-        financial_slice_bytes = None
+            board_slice_bytes = None
+            financial_slice_bytes = None
 
-        if is_heavy:
-            logger.warning(
-                f"⚠️  HEAVY REPORT DETECTED ({total_pages} pages > {HEAVY_REPORT_THRESHOLD})"
-            )
-            logger.info("Engaging Smart Mapping Strategy with gemini-3-pro-preview...")
+            if is_heavy:
+                logger.warning(
+                    f"⚠️  HEAVY REPORT DETECTED ({total_pages} pages > {HEAVY_REPORT_THRESHOLD})"
+                )
+                logger.info(f"Engaging Smart Mapping Strategy with {STRUCTURE_MODEL_NAME}...")
 
-            # A. Run AI-powered structure mapper
-            structure_map = map_report_structure(annual_bytes, model, annual_pdf.name)
+                # A. Run AI-powered structure mapper
+                structure_map = map_report_structure(
+                    annual_bytes, model, annual_pdf.name,
+                    cache=DiskCache(DEFAULT_CACHE_DIR / "structure", max_bytes=MAX_CACHE_BYTES)
+                )
 
-            # B. Create targeted slices (returns bytes, not files)
-            logger.info("Step 2b: Creating targeted PDF slices...")
-            slices = create_report_slices(annual_bytes, structure_map)
+                # B. Create targeted slices (returns bytes, not files)
+                logger.info("Step 2b: Creating targeted PDF slices...")
+                slice_cache = DiskCache(DEFAULT_CACHE_DIR / "slices", max_bytes=MAX_CACHE_BYTES)
+                if pdf_pool is not None:
+                    # The worker reads the PDF from shared memory instead of a pickled copy
+                    with shared_pdf_buffer(annual_bytes) as shm_name:
+                        slices = pdf_pool.submit(
+                            create_report_slices_from_shm, shm_name, len(annual_bytes),
+                            structure_map, cache=slice_cache
+                        ).result()
+                else:
+                    slices = create_report_slices(annual_bytes, structure_map, cache=slice_cache)
 
-            board_slice_bytes = slices.get('board_slice')
-            financial_slice_bytes = slices.get('financial_slice')
+                # pop, not get - the bytes are released after upload (see Step 5)
+                board_slice_bytes = slices.pop('board_slice', None)
+                financial_slice_bytes = slices.pop('financial_slice', None)
 
-            if not board_slice_bytes and not financial_slice_bytes:
-                logger.warning("Could not create slices, falling back to standard processing")
-                is_heavy = False
-        else:
-            logger.info(f"✅ Standard Report ({total_pages} pages). Using standard processing.")
-
-        # Step 3: Upload PDFs to Gemini
-        logger.info("Step 3: Uploading PDFs to Gemini...")
-
-        full_annual_uri = None
-        board_slice_uri = None
-        financial_slice_uri = None
-        quarterly_uri = None
-
-        if is_heavy:
-            # Upload slices
-            if board_slice_bytes:
-                board_slice_uri = upload_pdf_to_gemini(
-                    board_slice_bytes,
-                    f"board_slice_{annual_pdf.stem}.pdf"
-                )
-            if financial_slice_bytes:
-                financial_slice_uri = upload_pdf_to_gemini(
-                    financial_slice_bytes,
-                    f"financial_slice_{annual_pdf.stem}.pdf"
-                )
+                if not board_slice_bytes and not financial_slice_bytes:
+                    logger.warning("Could not create slices, falling back to standard processing")
+                    is_heavy = False
+            else:
+                logger.info(f"✅ Standard Report ({total_pages} pages). Using standard processing.")
 
-            if board_slice_uri is None and financial_slice_uri is None:
-                logger.error(f"Failed to upload any slices for {company_name}")
-                return False, ["UPLOAD_FAILED"]
-        else:
-            # Upload full annual report
-            full_annual_uri = upload_pdf_to_gemini(annual_bytes, annual_pdf.name)
-            if full_annual_uri is None:
+            # Step 3: Upload PDFs to Gemini
+            logger.info("Step 3: Uploading PDFs to Gemini...")
+
+            # Collect every file this company needs and upload them concurrently
+            upload_jobs = {}
+            if is_heavy:
+                if board_slice_bytes:
+                    upload_jobs['board'] = (board_slice_bytes, f"board_slice_{annual_pdf.stem}.pdf")
+                if financial_slice_bytes:
+                    upload_jobs['financial'] = (
+                        financial_slice_bytes, f"financial_slice_{annual_pdf.stem}.pdf"
+                    )
+            else:
+                upload_jobs['annual'] = (annual_bytes, annual_pdf.name)
+
+            # Upload quarterly if available
+            if quarterly_bytes:
+                upload_jobs['quarterly'] = (quarterly_bytes, quarterly_pdf.name)
+
+            uris = upload_pdfs_to_gemini(
+                upload_jobs,
+                cache=DiskCache(DEFAULT_CACHE_DIR / "uploads", max_bytes=MAX_CACHE_BYTES)
+            )
+            # Page counts let section generation skip doomed oversized Phase 1 calls
+            page_counts = {
+                uris[tag]: total_pages if tag == 'annual' else get_pdf_page_count(pdf_bytes)
+                for tag, (pdf_bytes, _) in upload_jobs.items()
+                if uris.get(tag)
+            }
+            full_annual_uri = uris.get('annual')
+            board_slice_uri = uris.get('board')
+            financial_slice_uri = uris.get('financial')
+            quarterly_uri = uris.get('quarterly')
+
+            if is_heavy:
+                if board_slice_uri is None and financial_slice_uri is None:
+                    logger.error(f"Failed to upload any slices for {company_name}")
+                    return False, ["UPLOAD_FAILED"]
+            elif full_annual_uri is None:
                 logger.error(f"Failed to upload annual report for {company_name}")
                 return False, ["UPLOAD_FAILED"]
 
-        # Upload quarterly if available
-        if quarterly_bytes:
-            quarterly_uri = upload_pdf_to_gemini(quarterly_bytes, quarterly_pdf.name)
-
         # Step 4: Extract holding chart (ownership structure diagram)
         logger.info("Step 4: Extracting holding chart...")
         output_company_dir = DEFAULT_OUTPUT_DIR / company_name
@@ -293,37 +426,50 @@ def process_company(company_dir: Path, model) -> tuple[bool, list[str]]:
         else:
             logger.warning("GOOGLE_API_KEY not set - skipping holding chart extraction")
 
-        # Step 5: Generate sections
-        logger.info("Step 5: Generating sections...")
-        html_sections = []
-
-        for section_id in SECTIONS:
-            if is_heavy:
-                # Route to appropriate slice based on section type
-                if section_id in BOARD_REPORT_SECTIONS:
-                    primary_uri = board_slice_uri or financial_slice_uri
-                    logger.info(f"[Heavy → Board Slice] {section_id}")
+        # The PDFs live on Gemini now - drop the local copies (often 50-200 MB)
+        # instead of holding them through the long section generation step
+        annual_bytes = quarterly_bytes = board_slice_bytes = financial_slice_bytes = None
+        upload_jobs.clear()
+
+        # Step 5: Generate the sections not served from the cache
+        missing_sections = [
+            section_id for section_id in SECTIONS if section_id not in section_results
+        ]
+        if missing_sections:
+            logger.info("Step 5: Generating sections...")
+            section_uris = {}
+
+            # Each slice falls back to the other if it could not be created
+            board_primary_uri = board_slice_uri or financial_slice_uri
+            financial_primary_uri = financial_slice_uri or board_slice_uri
+
+            for section_id in missing_sections:
+                if is_heavy:
+                    # Route to appropriate slice based on section type
+                    if section_id in BOARD_REPORT_SECTIONS:
+                        section_uris[section_id] = board_primary_uri
+                        logger.info(f"[Heavy → Board Slice] {section_id}")
+                    else:
+                        section_uris[section_id] = financial_primary_uri
+                        logger.info(f"[Heavy → Financial Slice] {section_id}")
                 else:
-                    primary_uri = financial_slice_uri or board_slice_uri
-                    logger.info(f"[Heavy → Financial Slice] {section_id}")
-
-                section_html = generate_section_with_fallback(
-                    section_id=section_id,
-                    primary_uri=primary_uri,
-                    secondary_uri=quarterly_uri,
-                    fallback_uri=primary_uri,
-                    company_name=company_name
-                )
-            else:
-                logger.info(f"[Standard] {section_id}")
-                section_html = generate_section_with_fallback(
-                    section_id=section_id,
-                    primary_uri=full_annual_uri,
-                    secondary_uri=quarterly_uri,
-                    fallback_uri=full_annual_uri,
-                    company_name=company_name
-                )
+                    logger.info(f"[Standard] {section_id}")
+                    section_uris[section_id] = full_annual_uri
+
+            generated = generate_sections(
+                section_uris=section_uris,
+                secondary_uri=quarterly_uri,
+                company_name=company_name,
+                page_counts=page_counts
+            )
+            for section_id, section_html in generated.items():
+                if is_section_ok(section_html):
+                    section_cache.set(section_keys[section_id], section_html.encode('utf-8'))
+            section_results.update(generated)
 
+        html_sections = []
+        for section_id in SECTIONS:
+            section_html = section_results[section_id]
             html_sections.append(section_html)
 
             # Insert holding chart after company_profile section
@@ -331,24 +477,18 @@ def process_company(company_dir: Path, model) -> tuple[bool, list[str]]:
                 holding_chart_html = create_holding_chart_html(holding_chart_path, company_name)
                 html_sections.append(holding_chart_html)
 
-            if 'class="error"' in section_html:
+            if not is_section_ok(section_html):
                 failed_sections.append(section_id)
 
-            time.sleep(API_DELAY)
+        # A report of error boxes only is not worth the PDF render - and
+        # must not overwrite an earlier report under --force
+        if len(failed_sections) == len(SECTIONS):
+            logger.error(f"❌ {company_name}: all sections failed, skipping HTML/PDF output")
+            return False, ["ALL_SECTIONS_FAILED", *failed_sections]
 
         # Step 6: Assemble and save HTML
         final_html = assemble_report(company_name, html_sections)
 
-        # Generate filename with company name and date
-        display_name = company_name.replace('_', ' ')
-        month_idx = int(time.strftime('%m')) - 1
-        year = time.strftime('%Y')
-        timestamp = f"{HEBREW_MONTHS[month_idx]} {year}"
-        report_filename = f"{display_name} דוח אנליזה - {timestamp}"
-
-        html_output_file = output_company_dir / f"{report_filename}.html"
-        pdf_output_file = output_company_dir / f"{report_filename}.pdf"
-
         if save_html_report(final_html, html_output_file):
             logger.info(f"HTML report saved to: {html_output_file}")
         else:
@@ -386,13 +526,22 @@ def process_company(company_dir: Path, model) -> tuple[bool, list[str]]:
 
 def main():
     """Main entry point for batch report generation."""
-    # Parse command line argument for company filter
-    company_filter = sys.argv[1] if len(sys.argv) > 1 else None
-
-    logger.info("=" * 60)
+    parser = argparse.ArgumentParser(description="Generate financial analysis reports")
+    parser.add_argument(
+        "company_filter", nargs="?",
+        help="Process only companies whose folder name contains this text"
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Regenerate reports that are already complete, ignoring cached sections"
+    )
+    args = parser.parse_args()
+    company_filter = args.company_filter
+
+    logger.info(SEPARATOR)
     logger.info("Starting Batch Financial Report Generator")
-    logger.info(f"Model: {MODEL_NAME} (single model for all operations)")
-    logger.info("=" * 60)
+    logger.info(f"Model: {MODEL_NAME} (sections), {STRUCTURE_MODEL_NAME} (structure mapping)")
+    logger.info(SEPARATOR)
 
     # Validate configuration
     is_valid, errors = validate_config()
@@ -401,9 +550,10 @@ def main():
             logger.error(error)
         return
 
-    # Configure Gemini and get model instance
+    # Configure Gemini - only structure mapping calls a model directly from here
     try:
-        model = configure_gemini()
+        configure_gemini()
+        model = get_structure_model()
     except Exception as e:
         logger.error(f"Failed to configure Gemini: {e}")
         return
@@ -416,8 +566,9 @@ def main():
     # Ensure output directory exists
     DEFAULT_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
-    # Find company directories
-    company_dirs = [d for d in DEFAULT_FINANCIAL_REPORTS_DIR.iterdir() if d.is_dir()]
+    # Find company directories (DirEntry.is_dir uses the type readdir already returned)
+    with os.scandir(DEFAULT_FINANCIAL_REPORTS_DIR) as it:
+        company_dirs = [Path(entry.path) for entry in it if entry.is_dir()]
 
     # Apply company filter if provided
     if company_filter:
@@ -439,26 +590,42 @@ def main():
     total_failed = 0
     all_failures = {}
 
-    for company_dir in sorted(company_dirs):
-        try:
-            success, failed_sections = process_company(company_dir, model)
-            if success:
-                fully_successful += 1
-            elif failed_sections and failed_sections[0] not in ["NO_FILES", "UPLOAD_FAILED", "READ_ERROR", "SAVE_ERROR", "EXCEPTION"]:
-                partial_success += 1
-                all_failures[company_dir.name] = failed_sections
-            else:
+    # Companies are independent and I/O bound - process them concurrently
+    # Tally each company as soon as it finishes rather than in submission order.
+    # PDF slicing is CPU-bound and holds the GIL, so it gets worker processes
+    # (spawned on first use - runs without heavy reports never start one).
+    pdf_pool = ProcessPoolExecutor(
+        max_workers=MAX_PDF_WORKERS, mp_context=multiprocessing.get_context("spawn")
+    )
+    with pdf_pool, ThreadPoolExecutor(
+        max_workers=min(MAX_CONCURRENT_COMPANIES, len(company_dirs))
+    ) as executor:
+        futures = {
+            executor.submit(process_company, company_dir, model, args.force, pdf_pool): company_dir
+            for company_dir in sorted(company_dirs)
+        }
+
+        for future in as_completed(futures):
+            company_dir = futures[future]
+            try:
+                success, failed_sections = future.result()
+                if success:
+                    fully_successful += 1
+                elif failed_sections and failed_sections[0] not in ["NO_FILES", "UPLOAD_FAILED", "READ_ERROR", "SAVE_ERROR", "ALL_SECTIONS_FAILED", "EXCEPTION"]:
+                    partial_success += 1
+                    all_failures[company_dir.name] = failed_sections
+                else:
+                    total_failed += 1
+                    all_failures[company_dir.name] = failed_sections
+            except Exception as e:
+                logger.error(f"Unexpected error processing {company_dir.name}: {e}")
                 total_failed += 1
-                all_failures[company_dir.name] = failed_sections
-        except Exception as e:
-            logger.error(f"Unexpected error processing {company_dir.name}: {e}")
-            total_failed += 1
-            all_failures[company_dir.name] = ["EXCEPTION"]
+                all_failures[company_dir.name] = ["EXCEPTION"]
 
     # Summary
-    logger.info("\n" + "=" * 60)
+    logger.info("\n" + SEPARATOR)
     logger.info("BATCH PROCESSING COMPLETE")
-    logger.info("=" * 60)
+    logger.info(SEPARATOR)
     logger.info(f"Fully successful (all sections): {fully_successful}")
     logger.info(f"Partial success (some sections failed): {partial_success}")
     logger.info(f"Failed (no report generated): {total_failed}")
@@ -466,14 +633,13 @@ def main():
     logger.info(f"Reports saved to: {DEFAULT_OUTPUT_DIR}")
 
     if all_failures:
-        logger.error("\n" + "=" * 60)
-        logger.error("⚠️  FAILURES REPORT - ACTION REQUIRED")
-        logger.error("=" * 60)
-        for company, sections in all_failures.items():
-            logger.error(f"  {company}:")
-            for section in sections:
-                logger.error(f"    - {section}")
-        logger.error("=" * 60)
+        # Build the whole report first and emit it with a single logging call
+        report_lines = ["", SEPARATOR, "⚠️  FAILURES REPORT - ACTION REQUIRED", SEPARATOR]
+        for company, sections in sorted(all_failures.items()):
+            report_lines.append(f"  {company}:")
+            report_lines.extend(f"    - {section}" for section in sections)
+        report_lines.append(SEPARATOR)
+        logger.error("\n".join(report_lines))
 
 
 if __name__ == "__main__":
@@ -2,11 +2,15 @@
 Core module for Financial Reports Service.
 
 This module contains all business logic for processing financial reports.
-The functions here are stateless and do not interact with the file system directly.
+The functions here work on bytes and return data; the file system is only
+touched by the on-disk cache (cache) and by holding_chart_extractor, which
+saves the extracted chart image to the directory it is given.
 
 Modules:
 - config: Settings and constants
 - ai_engine: Gemini API interaction and retry logic
+- rate_limiter: Token-bucket throttling for API calls
+- cache: On-disk cache for reusable intermediate results
 - pdf_processor: PyMuPDF slicing and text extraction
 - prompts: AI prompts for the 8 sections
 - report_builder: HTML report assembly
@@ -14,103 +18,123 @@ Modules:
 - holding_chart_extractor: Extract ownership structure charts from PDFs
 """
 
-from .config import (
-    GOOGLE_API_KEY,
-    SUPABASE_FUNCTION_URL,
-    SUPABASE_ANON_KEY,
-    MODEL_NAME,
-    SECTIONS,
-    BOARD_REPORT_SECTIONS,
-    FINANCIAL_STATEMENTS_SECTIONS,
-    SECTION_DISPLAY_NAMES,
-    MAX_RETRIES,
-    BASE_DELAY,
-    MAX_DELAY,
-    API_DELAY,
-    HEAVY_REPORT_THRESHOLD,
-    TOC_SCAN_PAGES,
-    DEFAULT_FINANCIAL_REPORTS_DIR,
-    DEFAULT_OUTPUT_DIR,
-    validate_config,
-)
+import importlib
 
-from .ai_engine import (
-    configure_gemini,
-    get_model,
-    generate_with_retry,
-    upload_pdf_to_gemini,
-    generate_section_with_fallback,
-)
+# Public names per defining submodule - the single list of the package's exports.
+# Submodules are imported on first attribute access (PEP 562), so importing
+# one submodule (e.g. core.config) does not load all the others.
+_LAZY_EXPORTS = {
+    'config': (
+        'GOOGLE_API_KEY',
+        'SUPABASE_FUNCTION_URL',
+        'SUPABASE_ANON_KEY',
+        'MODEL_NAME',
+        'STRUCTURE_MODEL_NAME',
+        'ENABLE_CONTEXT_CACHE',
+        'CONTEXT_CACHE_TTL_MINUTES',
+        'SECTIONS',
+        'BOARD_REPORT_SECTIONS',
+        'FINANCIAL_STATEMENTS_SECTIONS',
+        'SECTION_DISPLAY_NAMES',
+        'MAX_RETRIES',
+        'BASE_DELAY',
+        'MAX_DELAY',
+        'RETRY_JITTER',
+        'BREAKER_FAILURE_THRESHOLD',
+        'BREAKER_COOLDOWN',
+        'API_DELAY',
+        'MAX_CONCURRENT_COMPANIES',
+        'MAX_CONCURRENT_SECTIONS',
+        'SECTION_TIMEOUT',
+        'MAX_PDF_WORKERS',
+        'SECTION_CALL_RATE',
+        'SECTION_CALL_BURST',
+        'UPLOAD_RATE',
+        'UPLOAD_BURST',
+        'UPLOAD_POLL_INITIAL',
+        'UPLOAD_POLL_MAX',
+        'UPLOAD_POLL_JITTER',
+        'UPLOAD_PROCESSING_TIMEOUT',
+        'HEAVY_REPORT_THRESHOLD',
+        'TOC_SCAN_PAGES',
+        'TOC_MIN_PAGE_CHARS',
+        'TOC_MAX_CHARS',
+        'ESTIMATED_TOKENS_PER_PAGE',
+        'PHASE1_TOKEN_BUDGET',
+        'FINANCIAL_MIN_DIGITS',
+        'FINANCIAL_DIGIT_RATIO',
+        'DEFAULT_FINANCIAL_REPORTS_DIR',
+        'DEFAULT_OUTPUT_DIR',
+        'DEFAULT_CACHE_DIR',
+        'MAX_CACHE_BYTES',
+        'validate_config',
+    ),
+    'cache': (
+        'DiskCache',
+        'sha1_bytes',
+        'sha1_file',
+        'make_key',
+    ),
+    'rate_limiter': (
+        'TokenBucket',
+        'CircuitBreaker',
+    ),
+    'ai_engine': (
+        'configure_gemini',
+        'get_model',
+        'get_structure_model',
+        'generate_with_retry',
+        'upload_pdf_to_gemini',
+        'upload_pdfs_to_gemini',
+        'create_context_cache',
+        'delete_context_cache',
+        'is_section_ok',
+        'generate_section_with_fallback',
+        'generate_sections',
+    ),
+    'pdf_processor': (
+        'get_pdf_page_count',
+        'is_heavy_report',
+        'extract_toc_text',
+        'slice_pdf',
+        'map_report_structure',
+        'create_report_slices',
+        'shared_pdf_buffer',
+        'create_report_slices_from_shm',
+        'get_default_structure_map',
+    ),
+    'report_builder': (
+        'HEBREW_MONTHS',
+        'get_html_template',
+        'get_html_footer',
+        'assemble_report',
+        'create_error_section',
+    ),
+    'pdf_converter': (
+        'html_to_pdf',
+    ),
+    'holding_chart_extractor': (
+        'extract_holding_chart_page',
+        'create_holding_chart_html',
+    ),
+}
 
-from .pdf_processor import (
-    get_pdf_page_count,
-    is_heavy_report,
-    extract_toc_text,
-    slice_pdf,
-    map_report_structure,
-    create_report_slices,
-    get_default_structure_map,
-)
+_EXPORT_MODULES = {
+    name: module for module, names in _LAZY_EXPORTS.items() for name in names
+}
 
-from .report_builder import (
-    HEBREW_MONTHS,
-    get_html_template,
-    get_html_footer,
-    assemble_report,
-    create_error_section,
-)
+__all__ = list(_EXPORT_MODULES)
 
-from .pdf_converter import (
-    html_to_pdf,
-)
 
-from .holding_chart_extractor import (
-    extract_holding_chart_page,
-    create_holding_chart_html,
-)
+def __getattr__(name: str):
+    """Import the submodule defining `name` on first access and cache the attribute."""
+    module = _EXPORT_MODULES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
 
-__all__ = [
-    # Config
-    'GOOGLE_API_KEY',
-    'SUPABASE_FUNCTION_URL',
-    'SUPABASE_ANON_KEY',
-    'MODEL_NAME',
-    'SECTIONS',
-    'BOARD_REPORT_SECTIONS',
-    'FINANCIAL_STATEMENTS_SECTIONS',
-    'SECTION_DISPLAY_NAMES',
-    'MAX_RETRIES',
-    'BASE_DELAY',
-    'MAX_DELAY',
-    'API_DELAY',
-    'HEAVY_REPORT_THRESHOLD',
-    'TOC_SCAN_PAGES',
-    'DEFAULT_FINANCIAL_REPORTS_DIR',
-    'DEFAULT_OUTPUT_DIR',
-    'validate_config',
-    # AI Engine
-    'configure_gemini',
-    'get_model',
-    'generate_with_retry',
-    'upload_pdf_to_gemini',
-    'generate_section_with_fallback',
-    # PDF Processor
-    'get_pdf_page_count',
-    'is_heavy_report',
-    'extract_toc_text',
-    'slice_pdf',
-    'map_report_structure',
-    'create_report_slices',
-    'get_default_structure_map',
-    # Report Builder
-    'HEBREW_MONTHS',
-    'get_html_template',
-    'get_html_footer',
-    'assemble_report',
-    'create_error_section',
-    # PDF Converter
-    'html_to_pdf',
-    # Holding Chart Extractor
-    'extract_holding_chart_page',
-    'create_holding_chart_html',
-]
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -5,29 +5,113 @@ Handles all Gemini API interactions with robust exponential backoff retry logic.
 This module is stateless - it does not interact with the file system directly.
 """
 
+import io
+import re
 import time
+import random
 import logging
+import threading
+import datetime
+import email.utils
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import Optional
 
 import requests
+from requests.adapters import HTTPAdapter
 import google.generativeai as genai
 from google.api_core import exceptions as google_exceptions
 
+# orjson decodes response bytes directly and is several times faster on large
+# HTML payloads; fall back to the stdlib decoder when it is not installed
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    import json
+    _json_loads = json.loads
+
 from .config import (
     GOOGLE_API_KEY,
     MODEL_NAME,
+    STRUCTURE_MODEL_NAME,
+    ENABLE_CONTEXT_CACHE,
+    CONTEXT_CACHE_TTL_MINUTES,
     SUPABASE_FUNCTION_URL,
     SUPABASE_ANON_KEY,
     MAX_RETRIES,
     BASE_DELAY,
     MAX_DELAY,
+    RETRY_JITTER,
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_COOLDOWN,
+    MAX_CONCURRENT_COMPANIES,
+    MAX_CONCURRENT_SECTIONS,
+    SECTION_TIMEOUT,
+    ESTIMATED_TOKENS_PER_PAGE,
+    PHASE1_TOKEN_BUDGET,
+    SECTION_CALL_RATE,
+    SECTION_CALL_BURST,
+    UPLOAD_RATE,
+    UPLOAD_BURST,
+    UPLOAD_POLL_INITIAL,
+    UPLOAD_POLL_MAX,
+    UPLOAD_POLL_JITTER,
+    UPLOAD_PROCESSING_TIMEOUT,
     SECTION_DISPLAY_NAMES,
 )
+from .rate_limiter import TokenBucket, CircuitBreaker
+from .cache import DiskCache, sha1_bytes, make_key
 
 logger = logging.getLogger(__name__)
 
-# Global model instance - initialized once
+# Global model instances - initialized once
 _gemini_model: Optional[genai.GenerativeModel] = None
+_structure_model: Optional[genai.GenerativeModel] = None
+_configure_lock = threading.Lock()
+
+# Token-limit error signatures, matched in a single case-insensitive pass
+_TOKEN_LIMIT_RE = re.compile(
+    r'token|limit|exceed|invalidargument|resourceexhausted|too large|context length',
+    re.IGNORECASE
+)
+_RATE_LIMIT_RE = re.compile(
+    r'too many requests|rate limit|quota|429|resource exhausted',
+    re.IGNORECASE
+)
+# Transient Gemini SDK errors retried with backoff, and how each is logged
+_RETRYABLE_SDK_ERRORS = {
+    google_exceptions.ResourceExhausted: "Rate limit hit",
+    google_exceptions.ServiceUnavailable: "Service unavailable",
+    google_exceptions.DeadlineExceeded: "Timeout",
+}
+_RETRYABLE_SDK_ERROR_TYPES = tuple(_RETRYABLE_SDK_ERRORS)
+# Rate-limit signatures in Gemini SDK exception messages (generation and uploads)
+_SDK_RATE_LIMIT_RE = re.compile(r'429|resource|exhausted|quota', re.IGNORECASE)
+_ERROR_SNIPPET_BYTES = 512  # Error keywords appear up front - don't scan whole bodies/messages
+_RETRYABLE_STATUS_CODES = frozenset({500, 502, 503, 504})  # Transient server/gateway errors
+
+# Shared HTTP session for the Edge Function - keeps TCP/TLS connections alive
+# across section calls instead of reconnecting for every request
+_http = requests.Session()
+_http.headers.update({
+    "Content-Type": "application/json",
+    "Authorization": f"Bearer {SUPABASE_ANON_KEY}"
+})
+_http.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=MAX_CONCURRENT_COMPANIES * MAX_CONCURRENT_SECTIONS,
+    max_retries=0  # Retries are handled by call_section_api
+))
+
+# Gemini files already uploaded in this process, by content hash (sha1 -> file name)
+_uploaded_files: dict[str, str] = {}
+
+# Shared rate limiters - one per endpoint, across all companies and sections
+_section_bucket = TokenBucket(rate=SECTION_CALL_RATE, capacity=SECTION_CALL_BURST)
+_upload_bucket = TokenBucket(rate=UPLOAD_RATE, capacity=UPLOAD_BURST)
+
+# Opens after repeated 429/5xx/timeouts from the Edge Function - all sections then fail fast
+_section_breaker = CircuitBreaker(threshold=BREAKER_FAILURE_THRESHOLD, cooldown=BREAKER_COOLDOWN)
 
 
 # =============================================================================
@@ -38,21 +122,32 @@ def configure_gemini() -> genai.GenerativeModel:
     """
     Configure Google Generative AI and return the model instance.
 
+    Also creates the cheaper structure-mapping model (see get_structure_model).
+    Idempotent - later calls return the already configured model.
+
     Returns:
         Configured GenerativeModel instance
 
     Raises:
         ValueError: If GOOGLE_API_KEY is not set
     """
-    global _gemini_model
+    global _gemini_model, _structure_model
+
+    if _gemini_model is not None:
+        return _gemini_model
 
     if not GOOGLE_API_KEY:
         raise ValueError("GOOGLE_API_KEY environment variable is not set")
 
-    genai.configure(api_key=GOOGLE_API_KEY)
-    _gemini_model = genai.GenerativeModel(MODEL_NAME)
+    with _configure_lock:
+        if _gemini_model is None:
+            genai.configure(api_key=GOOGLE_API_KEY)
+            # Structure model first - get_structure_model() is ready once _gemini_model is set
+            _structure_model = genai.GenerativeModel(STRUCTURE_MODEL_NAME)
+            _gemini_model = genai.GenerativeModel(MODEL_NAME)
 
-    logger.info(f"Gemini API configured successfully with model: {MODEL_NAME}")
+            logger.info(f"Gemini API configured successfully with model: {MODEL_NAME}")
+            logger.info(f"Structure mapping model: {STRUCTURE_MODEL_NAME}")
     return _gemini_model
 
 
@@ -61,16 +156,49 @@ def get_model() -> Optional[genai.GenerativeModel]:
     return _gemini_model
 
 
+def get_structure_model() -> Optional[genai.GenerativeModel]:
+    """Get the Gemini model used for structure mapping."""
+    return _structure_model
+
+
 # =============================================================================
 # CORE RETRY WRAPPER
 # =============================================================================
 
+def _backoff_delay(base_delay: float, attempt: int) -> float:
+    """Exponential backoff capped at MAX_DELAY, stretched by up to RETRY_JITTER."""
+    delay = min(base_delay * (2 ** attempt), MAX_DELAY)
+    return round(delay * random.uniform(1, 1 + RETRY_JITTER), 1)
+
+
+def _suggested_retry_delay(error: Exception) -> Optional[float]:
+    """
+    Return the retry delay a Google API error carries (google.rpc.RetryInfo), if any.
+
+    Details arrive as protobuf messages over gRPC and as dicts over REST.
+    """
+    for detail in getattr(error, "details", None) or []:
+        if isinstance(detail, dict):
+            delay = detail.get("retryDelay")
+            if isinstance(delay, str) and delay.endswith("s"):
+                try:
+                    return float(delay[:-1])
+                except ValueError:
+                    continue
+        else:
+            delay = getattr(detail, "retry_delay", None)
+            if delay is not None:
+                return delay.seconds + delay.nanos / 1e9
+    return None
+
+
 def generate_with_retry(
     prompt: str,
     model: genai.GenerativeModel,
     operation_name: str = "API call",
     max_retries: int = MAX_RETRIES,
-    base_delay: int = BASE_DELAY
+    base_delay: int = BASE_DELAY,
+    generation_config: Optional[dict] = None
 ) -> Optional[str]:
     """
     Execute a Gemini API call with exponential backoff retry logic.
@@ -87,6 +215,7 @@ def generate_with_retry(
         operation_name: Description of the operation for logging
         max_retries: Maximum number of retry attempts
         base_delay: Base delay in seconds for exponential backoff
+        generation_config: Optional Gemini generation config (e.g. JSON mode + schema)
 
     Returns:
         Response text or None if all retries failed
@@ -95,9 +224,9 @@ def generate_with_retry(
 
     for attempt in range(max_retries):
         try:
-            logger.debug(f"  {operation_name}: Attempt {attempt + 1}/{max_retries}")
+            logger.debug("  %s: Attempt %d/%d", operation_name, attempt + 1, max_retries)
 
-            response = model.generate_content(prompt)
+            response = model.generate_content(prompt, generation_config=generation_config)
 
             if response and response.text:
                 return response.text.strip()
@@ -105,30 +234,16 @@ def generate_with_retry(
                 logger.warning(f"  {operation_name}: Empty response on attempt {attempt + 1}")
                 last_error = "Empty response"
 
-        except google_exceptions.ResourceExhausted as e:
-            wait_time = min(base_delay * (2 ** attempt), MAX_DELAY)
-            logger.warning(
-                f"⏳ Rate limit hit for {operation_name}. "
-                f"Waiting {wait_time}s before retry {attempt + 1}/{max_retries}..."
-            )
-            time.sleep(wait_time)
-            last_error = str(e)
-            continue
-
-        except google_exceptions.ServiceUnavailable as e:
-            wait_time = min(base_delay * (2 ** attempt), MAX_DELAY)
-            logger.warning(
-                f"⏳ Service unavailable for {operation_name}. "
-                f"Waiting {wait_time}s before retry {attempt + 1}/{max_retries}..."
+        except _RETRYABLE_SDK_ERROR_TYPES as e:
+            label = next(text for cls, text in _RETRYABLE_SDK_ERRORS.items() if isinstance(e, cls))
+            suggested = _suggested_retry_delay(e)
+            # Prefer the server's own delay (attempt 0 = just cap + jitter it)
+            wait_time = (
+                _backoff_delay(suggested, 0) if suggested is not None
+                else _backoff_delay(base_delay, attempt)
             )
-            time.sleep(wait_time)
-            last_error = str(e)
-            continue
-
-        except google_exceptions.DeadlineExceeded as e:
-            wait_time = min(base_delay * (2 ** attempt), MAX_DELAY)
             logger.warning(
-                f"⏳ Timeout for {operation_name}. "
+                f"⏳ {label} for {operation_name}. "
                 f"Waiting {wait_time}s before retry {attempt + 1}/{max_retries}..."
             )
             time.sleep(wait_time)
@@ -136,11 +251,9 @@ def generate_with_retry(
             continue
 
         except Exception as e:
-            error_str = str(e).lower()
-
             # Check if it's a rate limit error in the message
-            if '429' in error_str or 'resource' in error_str or 'exhausted' in error_str or 'quota' in error_str:
-                wait_time = min(base_delay * (2 ** attempt), MAX_DELAY)
+            if _SDK_RATE_LIMIT_RE.search(str(e), 0, _ERROR_SNIPPET_BYTES):
+                wait_time = _backoff_delay(base_delay, attempt)
                 logger.warning(
                     f"⏳ Rate limit (from error message) for {operation_name}. "
                     f"Waiting {wait_time}s before retry {attempt + 1}/{max_retries}..."
@@ -165,109 +278,262 @@ def generate_with_retry(
 # FILE UPLOAD TO GEMINI
 # =============================================================================
 
+def _find_uploaded_file(digest: str, cache: Optional[DiskCache]) -> Optional[str]:
+    """
+    Return the URI of a still-active Gemini file with the given content hash.
+
+    Args:
+        digest: SHA-1 of the PDF bytes
+        cache: Optional persistent record of earlier uploads
+
+    Returns:
+        The file URI if a live upload exists, None otherwise
+    """
+    file_name = _uploaded_files.get(digest)
+    if file_name is None and cache is not None:
+        cached = cache.get(make_key("upload", digest))
+        file_name = cached.decode("utf-8") if cached else None
+    if file_name is None:
+        return None
+
+    try:
+        uploaded_file = genai.get_file(file_name)
+    except Exception as e:
+        # Expired (Gemini keeps files for 48h) or deleted - upload again
+        logger.debug("Previously uploaded file %s is gone: %s", file_name, e)
+        _uploaded_files.pop(digest, None)
+        return None
+
+    if uploaded_file.state.name != "ACTIVE":
+        return None
+    _uploaded_files[digest] = file_name
+    return uploaded_file.uri
+
+
 def upload_pdf_to_gemini(
     pdf_bytes: bytes,
     display_name: str,
-    max_retries: int = 5
+    max_retries: int = 5,
+    cache: Optional[DiskCache] = None
 ) -> Optional[str]:
     """
     Upload PDF bytes to Gemini with retry logic.
 
+    Identical content is uploaded only once: earlier uploads are looked up by
+    SHA-1 (in memory, then in the optional cache) and reused while still active.
+
     Args:
         pdf_bytes: The PDF file content as bytes
         display_name: Display name for the uploaded file
         max_retries: Maximum number of upload attempts
+        cache: Optional cache persisting content hash -> Gemini file name
 
     Returns:
         The file URI if successful, None otherwise
     """
-    import tempfile
-    import os
+    digest = sha1_bytes(pdf_bytes)
+    existing_uri = _find_uploaded_file(digest, cache)
+    if existing_uri:
+        logger.info(f"Reusing earlier upload of {display_name}: {existing_uri}")
+        return existing_uri
 
     logger.info(f"Uploading {display_name} to Gemini...")
 
-    # Create a temporary file to upload (Gemini SDK requires a file path)
-    temp_file = None
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as f:
-            f.write(pdf_bytes)
-            temp_file = f.name
-
-        for attempt in range(max_retries):
-            try:
-                uploaded_file = genai.upload_file(
-                    path=temp_file,
-                    display_name=display_name
-                )
-
-                logger.info(f"Waiting for {display_name} to be processed...")
-                while uploaded_file.state.name == "PROCESSING":
-                    time.sleep(2)
-                    uploaded_file = genai.get_file(uploaded_file.name)
+    for attempt in range(max_retries):
+        try:
+            _upload_bucket.acquire()
+            # Stream straight from memory - no temporary file round-trip
+            uploaded_file = genai.upload_file(
+                path=io.BytesIO(pdf_bytes),
+                mime_type="application/pdf",
+                display_name=display_name
+            )
 
-                if uploaded_file.state.name == "ACTIVE":
-                    logger.info(f"Successfully uploaded {display_name}: {uploaded_file.uri}")
-                    return uploaded_file.uri
-                else:
+            logger.info(f"Waiting for {display_name} to be processed...")
+            poll_delay = UPLOAD_POLL_INITIAL
+            processing_deadline = time.monotonic() + UPLOAD_PROCESSING_TIMEOUT
+            while uploaded_file.state.name == "PROCESSING":
+                if time.monotonic() >= processing_deadline:
                     logger.error(
-                        f"File {display_name} failed to process. State: {uploaded_file.state.name}"
+                        f"File {display_name} still processing after {UPLOAD_PROCESSING_TIMEOUT}s, giving up"
                     )
                     return None
+                time.sleep(poll_delay * random.uniform(1 - UPLOAD_POLL_JITTER, 1 + UPLOAD_POLL_JITTER))
+                uploaded_file = genai.get_file(uploaded_file.name)
+                poll_delay = min(poll_delay * 1.5, UPLOAD_POLL_MAX)
+
+            if uploaded_file.state.name == "ACTIVE":
+                logger.info(f"Successfully uploaded {display_name}: {uploaded_file.uri}")
+                _uploaded_files[digest] = uploaded_file.name
+                if cache is not None:
+                    cache.set(make_key("upload", digest), uploaded_file.name.encode("utf-8"))
+                return uploaded_file.uri
+            else:
+                logger.error(
+                    f"File {display_name} failed to process. State: {uploaded_file.state.name}"
+                )
+                return None
 
-            except Exception as e:
-                error_str = str(e).lower()
-                if '429' in error_str or 'resource' in error_str or 'exhausted' in error_str:
-                    wait_time = BASE_DELAY * (2 ** attempt)
-                    logger.warning(
-                        f"⏳ Rate limit on upload. "
-                        f"Waiting {wait_time}s before retry {attempt + 1}/{max_retries}..."
-                    )
-                    time.sleep(wait_time)
-                    continue
+        except Exception as e:
+            if _SDK_RATE_LIMIT_RE.search(str(e), 0, _ERROR_SNIPPET_BYTES):
+                _upload_bucket.penalize()
+                wait_time = _backoff_delay(BASE_DELAY, attempt)
+                logger.warning(
+                    f"⏳ Rate limit on upload. "
+                    f"Waiting {wait_time}s before retry {attempt + 1}/{max_retries}..."
+                )
+                time.sleep(wait_time)
+                continue
 
-                logger.warning(f"Upload attempt {attempt + 1} failed for {display_name}: {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(5)
-                else:
-                    logger.error(f"Failed to upload {display_name} after {max_retries} attempts")
-                    return None
+            logger.warning(f"Upload attempt {attempt + 1} failed for {display_name}: {e}")
+            if attempt < max_retries - 1:
+                time.sleep(5)
+            else:
+                logger.error(f"Failed to upload {display_name} after {max_retries} attempts")
+                return None
+
+    return None
+
+
+def upload_pdfs_to_gemini(
+    files: dict[str, tuple[bytes, str]],
+    cache: Optional[DiskCache] = None
+) -> dict[str, Optional[str]]:
+    """
+    Upload several PDFs to Gemini concurrently.
 
+    Uploads and their PROCESSING polls are independent, so running them in
+    parallel makes the upload step cost roughly the slowest file, not the sum.
+
+    Args:
+        files: Mapping of tag to (pdf_bytes, display_name)
+        cache: Optional cache of earlier uploads (see upload_pdf_to_gemini)
+
+    Returns:
+        Mapping of tag to file URI (None for failed uploads)
+    """
+    if not files:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=len(files)) as executor:
+        futures = {
+            tag: executor.submit(upload_pdf_to_gemini, pdf_bytes, display_name, cache=cache)
+            for tag, (pdf_bytes, display_name) in files.items()
+        }
+        return {tag: future.result() for tag, future in futures.items()}
+
+
+# =============================================================================
+# CONTEXT CACHING
+# =============================================================================
+
+def create_context_cache(
+    file_uris: list[str],
+    display_name: str,
+    ttl_minutes: int = CONTEXT_CACHE_TTL_MINUTES
+) -> Optional[str]:
+    """
+    Create a Gemini context cache holding the given uploaded PDFs.
+
+    Args:
+        file_uris: Uploaded PDF file URIs to cache (None entries are skipped)
+        display_name: Display name for the cache
+        ttl_minutes: Time-to-live for the cache
+
+    Returns:
+        The cache name if successful, None otherwise
+    """
+    parts = [
+        genai.protos.Part(
+            file_data=genai.protos.FileData(mime_type="application/pdf", file_uri=uri)
+        )
+        for uri in file_uris if uri
+    ]
+
+    try:
+        cache = genai.caching.CachedContent.create(
+            model=f"models/{MODEL_NAME}",
+            display_name=display_name,
+            contents=[{"role": "user", "parts": parts}],
+            ttl=datetime.timedelta(minutes=ttl_minutes)
+        )
+        logger.info(f"Created context cache for {display_name}: {cache.name}")
+        return cache.name
+    except Exception as e:
+        logger.warning(f"Could not create context cache for {display_name}: {e}")
         return None
 
-    finally:
-        # Clean up temporary file
-        if temp_file and os.path.exists(temp_file):
-            try:
-                os.unlink(temp_file)
-            except Exception:
-                pass
+
+def delete_context_cache(cache_name: str) -> None:
+    """Delete a Gemini context cache, ignoring errors (it expires anyway)."""
+    try:
+        genai.caching.CachedContent(cache_name).delete()
+    except Exception as e:
+        logger.warning(f"Could not delete context cache {cache_name}: {e}")
 
 
 # =============================================================================
 # SECTION GENERATION VIA SUPABASE EDGE FUNCTION
 # =============================================================================
 
+def _error_snippet(response: requests.Response) -> str:
+    """Decode only the head of an error body for keyword matching."""
+    return response.content[:_ERROR_SNIPPET_BYTES].decode("utf-8", "ignore")
+
+
+def _retry_after_seconds(response: requests.Response) -> Optional[float]:
+    """Parse a Retry-After header (delta-seconds or HTTP date), if the server sent one."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
 def is_token_limit_error(response: requests.Response) -> bool:
     """Check if the error is related to token limits."""
     if response.status_code == 400:
         return True
-    error_text = response.text.lower()
-    token_limit_keywords = [
-        'token', 'limit', 'exceed', 'invalidargument',
-        'resourceexhausted', 'too large', 'context length'
-    ]
-    return any(keyword in error_text for keyword in token_limit_keywords)
+    return bool(_TOKEN_LIMIT_RE.search(_error_snippet(response)))
 
 
 def is_rate_limit_error(response: requests.Response) -> bool:
     """Check if the error is a rate limit (429) error."""
     if response.status_code == 429:
         return True
-    error_text = response.text.lower()
-    rate_limit_keywords = [
-        'too many requests', 'rate limit', 'quota', '429', 'resource exhausted'
-    ]
-    return any(keyword in error_text for keyword in rate_limit_keywords)
+    return bool(_RATE_LIMIT_RE.search(_error_snippet(response)))
+
+
+def _wait_for_retry(wait_time: float, deadline: Optional[float], display_name: str) -> bool:
+    """
+    Sleep before a retry unless the wait would run past the section deadline.
+
+    Returns:
+        True if the caller should retry, False if it should give up now
+    """
+    if deadline is not None and time.monotonic() + wait_time >= deadline:
+        logger.error(f"Giving up on {display_name}: a {wait_time}s retry wait would pass its deadline")
+        return False
+    time.sleep(wait_time)
+    return True
+
+
+def _record_section_failure() -> None:
+    """Count a failed Edge Function attempt towards the circuit breaker."""
+    if _section_breaker.record_failure():
+        logger.error(
+            f"🛑 {BREAKER_FAILURE_THRESHOLD} consecutive Edge Function failures - "
+            f"failing section calls fast for {BREAKER_COOLDOWN}s"
+        )
 
 
 def call_section_api(
@@ -275,17 +541,26 @@ def call_section_api(
     file_uri1: str,
     file_uri2: Optional[str],
     company_name: str,
-    display_name: str
+    display_name: str,
+    cached_content_name: Optional[str] = None,
+    deadline: Optional[float] = None
 ) -> tuple[Optional[str], bool]:
     """
     Make API call to generate a section with exponential backoff retry.
 
+    With a deadline, request timeouts are clamped to the time left and a retry
+    whose backoff would overrun it is abandoned, so the worker thread is freed
+    instead of sleeping for a result nobody will wait for. While the shared
+    circuit breaker is open (sustained 429/5xx/timeouts), calls fail immediately.
+
     Args:
         section_id: The section identifier
         file_uri1: Primary PDF file URI
         file_uri2: Secondary PDF file URI (optional)
         company_name: Name of the company
         display_name: Display name for logging
+        cached_content_name: Gemini context cache holding both files (optional)
+        deadline: time.monotonic() value after which no further attempt is made
 
     Returns:
         Tuple of (html_content, is_token_error)
@@ -298,28 +573,48 @@ def call_section_api(
         "companyName": company_name,
         "model": MODEL_NAME
     }
+    if cached_content_name:
+        payload["cachedContentName"] = cached_content_name
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {SUPABASE_ANON_KEY}"
-    }
+    # Same inputs -> same key on every retry, so the Edge Function can answer a
+    # retry whose original request succeeded (response lost) without regenerating
+    headers = {"Idempotency-Key": make_key(section_id, file_uri1, file_uri2, company_name, MODEL_NAME)}
 
     rate_limit_retries = 0
     general_retries = 0
     max_general_retries = 3
 
-    while True:
+    # Every retry spends one of the two budgets, so this bound is never hit in
+    # practice - it guarantees termination if a new branch forgets to count
+    for _ in range(MAX_RETRIES + max_general_retries):
+        if _section_breaker.is_open():
+            logger.error(f"Edge Function circuit open - skipping {display_name}")
+            return None, False
+
         try:
-            response = requests.post(
+            timeout = 300  # 5 minute timeout for heavy operations
+            if deadline is None:
+                _section_bucket.acquire()
+            else:
+                acquired = _section_bucket.try_acquire(max_wait=deadline - time.monotonic())
+                timeout = min(timeout, deadline - time.monotonic())
+                if not acquired or timeout <= 0:
+                    logger.error(f"Deadline reached for {display_name} before the request was sent")
+                    return None, False
+            response = _http.post(
                 SUPABASE_FUNCTION_URL,
                 json=payload,
                 headers=headers,
-                timeout=300  # 5 minute timeout for heavy operations
+                timeout=timeout
             )
 
             if response.status_code == 200:
-                data = response.json()
-                html_content = data.get("html", data.get("content", ""))
+                _section_breaker.record_success()
+                data = _json_loads(response.content)
+                html_content = data.get("html") or data.get("content") or ""
+                cached_tokens = data.get("usageMetadata", {}).get("cachedContentTokenCount")
+                if cached_tokens is not None:
+                    logger.info(f"    {display_name}: {cached_tokens} cached input tokens")
                 if html_content:
                     return html_content, False
                 else:
@@ -327,15 +622,22 @@ def call_section_api(
 
             # Rate limit - exponential backoff
             if is_rate_limit_error(response):
+                _section_bucket.penalize()
+                _record_section_failure()
                 rate_limit_retries += 1
                 if rate_limit_retries <= MAX_RETRIES:
-                    wait_time = min(BASE_DELAY * (2 ** (rate_limit_retries - 1)), MAX_DELAY)
+                    retry_after = _retry_after_seconds(response)
+                    wait_time = (
+                        _backoff_delay(retry_after, 0) if retry_after is not None
+                        else _backoff_delay(BASE_DELAY, rate_limit_retries - 1)
+                    )
                     logger.warning(
                         f"⏳ Rate limit hit for {display_name}. "
                         f"Waiting {wait_time}s before retry {rate_limit_retries}/{MAX_RETRIES}..."
                     )
-                    time.sleep(wait_time)
-                    continue
+                    if _wait_for_retry(wait_time, deadline, display_name):
+                        continue
+                    return None, False
                 else:
                     logger.error(f"Rate limit exceeded max retries for {display_name}")
                     return None, False
@@ -344,17 +646,25 @@ def call_section_api(
             if is_token_limit_error(response):
                 return None, True
 
-            # Other 500 errors
-            if response.status_code == 500:
+            if response.status_code >= 500:
+                _record_section_failure()
+
+            # Other transient server errors - a 503 usually says when to come back
+            if response.status_code in _RETRYABLE_STATUS_CODES:
                 general_retries += 1
                 if general_retries < max_general_retries:
-                    wait_time = 10 * general_retries
+                    retry_after = _retry_after_seconds(response)
+                    wait_time = (
+                        _backoff_delay(retry_after, 0) if retry_after is not None
+                        else 10 * general_retries
+                    )
                     logger.warning(
-                        f"Attempt {general_retries} failed for {display_name} (500 error), "
-                        f"retrying in {wait_time}s..."
+                        f"Attempt {general_retries} failed for {display_name} "
+                        f"({response.status_code} error), retrying in {wait_time}s..."
                     )
-                    time.sleep(wait_time)
-                    continue
+                    if _wait_for_retry(wait_time, deadline, display_name):
+                        continue
+                    return None, False
                 else:
                     logger.error(
                         f"API error for {display_name}: "
@@ -368,26 +678,45 @@ def call_section_api(
             return None, False
 
         except requests.exceptions.Timeout:
+            _record_section_failure()
             general_retries += 1
             if general_retries < max_general_retries:
                 logger.warning(
                     f"Timeout on attempt {general_retries} for {display_name}, retrying..."
                 )
-                time.sleep(10)
-                continue
+                if _wait_for_retry(10, deadline, display_name):
+                    continue
+                return None, False
             logger.error(f"Timeout for {display_name} after {general_retries} attempts")
             return None, False
         except Exception as e:
             logger.error(f"Exception generating {display_name}: {e}")
             return None, False
 
+    logger.error(f"Retry budget exhausted for {display_name}")
+    return None, False
+
+
+def is_section_ok(section_html: str) -> bool:
+    """
+    True if the HTML is a generated section rather than an error div.
+
+    Generated sections always start with the section wrapper, so this is a
+    prefix check - no scan of the (long) model output, which may itself
+    legitimately contain class="error".
+    """
+    return section_html.startswith('<div class="section" id="')
+
 
 def generate_section_with_fallback(
     section_id: str,
     primary_uri: str,
     secondary_uri: Optional[str],
     fallback_uri: str,
-    company_name: str
+    company_name: str,
+    cached_content_name: Optional[str] = None,
+    skip_phase1: bool = False,
+    deadline: Optional[float] = None
 ) -> str:
     """
     Generate a report section with smart fallback for token limit errors.
@@ -398,31 +727,41 @@ def generate_section_with_fallback(
         secondary_uri: Secondary PDF file URI (optional)
         fallback_uri: Fallback PDF URI if token limit is hit
         company_name: Name of the company
+        cached_content_name: Context cache for primary + secondary (Phase 1 only)
+        skip_phase1: Go straight to the fallback file (inputs known to be too large)
+        deadline: time.monotonic() value shared by both phases (see call_section_api)
 
     Returns:
-        HTML string for the section (or error div)
+        HTML string for the section (or error div - see is_section_ok)
     """
     display_name = SECTION_DISPLAY_NAMES.get(section_id, section_id)
     logger.info(f"  Generating: {display_name} ({section_id})...")
 
-    # Phase 1: Try with primary + secondary files
-    files_desc = "primary + secondary" if secondary_uri else "primary only"
-    logger.info(f"    Phase 1: Attempting with {files_desc}...")
-
-    html_content, is_token_error = call_section_api(
-        section_id, primary_uri, secondary_uri, company_name, display_name
-    )
+    if skip_phase1 and secondary_uri:
+        # Estimated input is over budget - a two-file call would only time out
+        logger.warning("    ⚠️ Inputs exceed token budget - skipping Phase 1")
+        html_content, is_token_error = None, True
+    else:
+        # Phase 1: Try with primary + secondary files
+        files_desc = "primary + secondary" if secondary_uri else "primary only"
+        logger.info(f"    Phase 1: Attempting with {files_desc}...")
+
+        html_content, is_token_error = call_section_api(
+            section_id, primary_uri, secondary_uri, company_name, display_name,
+            cached_content_name, deadline
+        )
 
-    if html_content:
-        logger.info(f"    ✓ Successfully generated {display_name}")
-        return f'<div class="section" id="{section_id}">\n{html_content}\n</div>'
+        if html_content:
+            logger.info(f"    ✓ Successfully generated {display_name}")
+            return f'<div class="section" id="{section_id}">\n{html_content}\n</div>'
 
     # Phase 2: Fallback to single file if token limit error
     if is_token_error:
         logger.warning(f"    ⚠️ Token Limit Hit - Retrying with fallback file only...")
 
         html_content, is_token_error_2 = call_section_api(
-            section_id, fallback_uri, None, company_name, display_name
+            section_id, fallback_uri, None, company_name, display_name,
+            deadline=deadline
         )
 
         if html_content:
@@ -443,3 +782,111 @@ def generate_section_with_fallback(
 
     logger.error(f"    ❌ {display_name} failed (not a token limit error)")
     return f'<div class="error">שגיאה בייצור {display_name}</div>'
+
+
+def _timed_section(section_id: str, section_timeout: float, **kwargs) -> str:
+    """Run generate_section_with_fallback within section_timeout and log its wall time."""
+    start = time.monotonic()
+    html = generate_section_with_fallback(
+        section_id=section_id, deadline=start + section_timeout, **kwargs
+    )
+    logger.info(f"    ⏱ {section_id} finished in {time.monotonic() - start:.1f}s")
+    return html
+
+
+def generate_sections(
+    section_uris: dict[str, str],
+    secondary_uri: Optional[str],
+    company_name: str,
+    max_workers: int = MAX_CONCURRENT_SECTIONS,
+    use_context_cache: bool = ENABLE_CONTEXT_CACHE,
+    section_timeout: float = SECTION_TIMEOUT,
+    page_counts: Optional[dict[str, int]] = None
+) -> dict[str, str]:
+    """
+    Generate several report sections concurrently.
+
+    Each section is an independent, network-bound call to the Edge Function,
+    so they are issued from a bounded thread pool instead of one by one.
+    When context caching is enabled, one cache is created per distinct primary
+    file (plus the secondary file) and deleted once all sections are done.
+    Each section gets section_timeout from the moment a worker starts it (a
+    retry deadline inside the worker, so it stops backing off instead of holding
+    its thread). The caller waits once, against a single deadline covering every
+    wave of max_workers sections; a section that fails or is still unfinished
+    then becomes an error div, so one slow call cannot stall or abort the whole
+    company.
+    When page counts are known and primary + secondary are estimated to exceed
+    PHASE1_TOKEN_BUDGET, the doomed two-file attempt is skipped.
+
+    Args:
+        section_uris: Mapping of section_id to its primary PDF file URI
+        secondary_uri: Secondary PDF file URI (optional)
+        company_name: Name of the company
+        max_workers: Maximum number of section calls in flight
+        use_context_cache: Whether to create Gemini context caches
+        section_timeout: Max seconds one section may run, including its retries
+        page_counts: Optional mapping of file URI to its page count
+
+    Returns:
+        Mapping of section_id to its HTML (or error div)
+    """
+    page_counts = page_counts or {}
+
+    def over_budget(primary_uri: str) -> bool:
+        pages = page_counts.get(primary_uri, 0) + page_counts.get(secondary_uri, 0)
+        return pages * ESTIMATED_TOKENS_PER_PAGE > PHASE1_TOKEN_BUDGET
+
+    cache_names = {}
+    if use_context_cache:
+        for primary_uri in dict.fromkeys(section_uris.values()):
+            if over_budget(primary_uri):
+                continue  # Phase 1 is skipped, so a cache would go unused
+            cache_name = create_context_cache(
+                [primary_uri, secondary_uri],
+                f"{company_name} ({len(cache_names) + 1})"
+            )
+            if cache_name:
+                cache_names[primary_uri] = cache_name
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {
+            section_id: executor.submit(
+                _timed_section,
+                section_id=section_id,
+                section_timeout=section_timeout,
+                primary_uri=primary_uri,
+                secondary_uri=secondary_uri,
+                fallback_uri=primary_uri,
+                company_name=company_name,
+                cached_content_name=cache_names.get(primary_uri),
+                skip_phase1=over_budget(primary_uri)
+            )
+            for section_id, primary_uri in section_uris.items()
+        }
+
+        # One absolute bound for the whole batch: sections run in waves of
+        # max_workers, each wave limited by the per-section deadline
+        waves = -(-len(futures) // max_workers)
+        done, _ = wait(futures.values(), timeout=section_timeout * waves)
+
+        results = {}
+        for section_id, future in futures.items():
+            display_name = SECTION_DISPLAY_NAMES.get(section_id, section_id)
+            if future not in done:
+                future.cancel()
+                logger.error(f"    ❌ {display_name} timed out after {section_timeout}s")
+                results[section_id] = f'<div class="error">שגיאה בייצור {display_name} (חריגת זמן)</div>'
+                continue
+            try:
+                results[section_id] = future.result()
+            except Exception as e:
+                logger.error(f"    ❌ {display_name} raised an exception: {e}")
+                results[section_id] = f'<div class="error">שגיאה בייצור {display_name}</div>'
+        return results
+    finally:
+        # Don't block on sections that timed out - their results are discarded
+        executor.shutdown(wait=False, cancel_futures=True)
+        for cache_name in cache_names.values():
+            delete_context_cache(cache_name)
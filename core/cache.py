@@ -0,0 +1,112 @@
+"""
+Cache module for Financial Reports Service.
+
+A minimal on-disk key/value store used to reuse expensive intermediate
+results (PDF slices, generated sections, ...) across runs.
+Callers own the cache directory; nothing is cached unless a cache is passed in.
+"""
+
+import os
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def sha1_bytes(data: bytes) -> str:
+    """Return the SHA-1 hex digest of a bytes object."""
+    return hashlib.sha1(data).hexdigest()
+
+
+def sha1_file(path: Path, chunk_size: int = 1 << 20) -> str:
+    """Return the SHA-1 hex digest of a file, reading it in chunks."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_key(*parts) -> str:
+    """Build a cache key from arbitrary parts (stringified and hashed)."""
+    return hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """
+    One-file-per-key cache rooted at a directory.
+
+    Entries are written atomically (temporary file + os.replace), so
+    concurrent workers and interrupted runs never see partial values.
+    With a size budget, least-recently-used entries are evicted on write.
+
+    Args:
+        directory: Directory holding the cache entries (created if missing)
+        max_bytes: Optional size budget for the directory
+    """
+
+    def __init__(self, directory: Path, max_bytes: Optional[int] = None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the cached value for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            value = path.read_bytes()
+            os.utime(path)  # Mark as recently used (atime is often not updated)
+            return value
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Cache read failed for {key}: {e}")
+            return None
+
+    def set(self, key: str, value: bytes) -> None:
+        """Store value under key (errors are logged, never raised)."""
+        path = self._path(key)
+        temp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            temp_path.write_bytes(value)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Cache write failed for {key}: {e}")
+            temp_path.unlink(missing_ok=True)
+            return
+
+        if self.max_bytes is not None:
+            self._evict()
+
+    def _evict(self) -> None:
+        """Delete least-recently-used entries until the directory fits max_bytes."""
+        entries = []
+        total_bytes = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.startswith('.') or not entry.is_file():
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # Removed by a concurrent writer
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+                total_bytes += stat.st_size
+
+        if total_bytes <= self.max_bytes:
+            return
+
+        for _, size, path in sorted(entries):
+            try:
+                os.unlink(path)
+                total_bytes -= size
+            except OSError:
+                continue
+            if total_bytes <= self.max_bytes:
+                break
@@ -7,6 +7,7 @@ Both CLI and Server can import settings from here.
 
 import os
 from pathlib import Path
+from types import MappingProxyType
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -28,12 +29,18 @@ SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY", "")
 # =============================================================================
 
 MODEL_NAME = "gemini-3-pro-preview"
+STRUCTURE_MODEL_NAME = "gemini-flash-latest"  # Cheaper model for the TOC -> page-range JSON extraction
+
+# Explicit context caching - the uploaded PDFs are cached once per company and
+# the Edge Function reuses the cache for every section instead of re-ingesting them
+ENABLE_CONTEXT_CACHE = os.getenv("ENABLE_CONTEXT_CACHE", "false").lower() == "true"
+CONTEXT_CACHE_TTL_MINUTES = 30
 
 # =============================================================================
 # REPORT SECTIONS
 # =============================================================================
 
-SECTIONS = [
+SECTIONS = (
     'company_profile',
     'executive_summary',
     'business_environment',
@@ -42,25 +49,25 @@ SECTIONS = [
     'financial_analysis',
     'cash_flow_and_liquidity',
     'liquidation_analysis'
-]
+)
 
 # Section routing for heavy reports - which sections use which PDF slice
-BOARD_REPORT_SECTIONS = {
+BOARD_REPORT_SECTIONS = frozenset({
     'company_profile',
     'executive_summary',
     'business_environment',
     'asset_portfolio_analysis'
-}
+})
 
-FINANCIAL_STATEMENTS_SECTIONS = {
+FINANCIAL_STATEMENTS_SECTIONS = frozenset({
     'debt_structure',
     'financial_analysis',
     'cash_flow_and_liquidity',
     'liquidation_analysis'
-}
+})
 
-# Section display names (Hebrew)
-SECTION_DISPLAY_NAMES = {
+# Section display names (Hebrew) - read-only, shared by all worker threads
+SECTION_DISPLAY_NAMES = MappingProxyType({
     'company_profile': 'פרופיל חברה',
     'executive_summary': 'תקציר מנהלים',
     'business_environment': 'סביבה עסקית',
@@ -69,7 +76,7 @@ SECTION_DISPLAY_NAMES = {
     'financial_analysis': 'ניתוח פיננסי',
     'cash_flow_and_liquidity': 'תזרים מזומנים ונזילות',
     'liquidation_analysis': 'ניתוח פירוק'
-}
+})
 
 # =============================================================================
 # RETRY CONFIGURATION - EXPONENTIAL BACKOFF
@@ -78,14 +85,46 @@ SECTION_DISPLAY_NAMES = {
 MAX_RETRIES = 6
 BASE_DELAY = 30  # Starting delay in seconds
 MAX_DELAY = 600  # Maximum delay (10 minutes)
+RETRY_JITTER = 0.2  # Up to +20% random extra wait, so callers that failed together retry apart
+BREAKER_FAILURE_THRESHOLD = 5  # Consecutive section-call failures (429/5xx/timeout) that open the circuit
+BREAKER_COOLDOWN = 60  # Seconds section calls fail fast once the circuit is open
 API_DELAY = 5.0  # Delay between API calls (seconds)
 
+# =============================================================================
+# CONCURRENCY CONFIGURATION
+# =============================================================================
+
+# Overridable per deployment - raise them until the Edge Function / Gemini quota is the limit
+MAX_CONCURRENT_COMPANIES = int(os.getenv("MAX_CONCURRENT_COMPANIES", "2"))  # Companies processed in parallel by the CLI
+MAX_CONCURRENT_SECTIONS = int(os.getenv("MAX_CONCURRENT_SECTIONS", "4"))  # Section API calls in flight per company
+SECTION_TIMEOUT = 900  # Max seconds one section may run (including its retries)
+MAX_PDF_WORKERS = min(4, os.cpu_count() or 1)  # Processes for PDF slicing - PyMuPDF holds the GIL
+
+# =============================================================================
+# RATE LIMITING - PROACTIVE TOKEN BUCKETS
+# =============================================================================
+
+SECTION_CALL_RATE = 1 / API_DELAY  # Sustained section calls per second (all companies)
+SECTION_CALL_BURST = MAX_CONCURRENT_SECTIONS  # Section calls allowed back-to-back
+UPLOAD_RATE = 0.5  # Sustained Gemini uploads per second
+UPLOAD_BURST = 3  # Gemini uploads allowed back-to-back
+UPLOAD_POLL_INITIAL = 0.5  # First wait (seconds) while an upload is PROCESSING
+UPLOAD_POLL_MAX = 5.0  # Upper bound for the PROCESSING poll interval
+UPLOAD_POLL_JITTER = 0.2  # +/- fraction applied to each poll wait so concurrent uploads drift apart
+UPLOAD_PROCESSING_TIMEOUT = 600  # Give up on an upload still PROCESSING after this many seconds
+
 # =============================================================================
 # PDF PROCESSING CONFIGURATION
 # =============================================================================
 
 HEAVY_REPORT_THRESHOLD = 300  # Pages threshold for "heavy" reports
 TOC_SCAN_PAGES = 30  # Number of pages to scan for TOC
+TOC_MIN_PAGE_CHARS = 200  # Pages with less text (covers, charts, photos) are left out of the TOC
+TOC_MAX_CHARS = 12000  # TOC text budget for the mapping prompt - extraction stops once it is filled
+ESTIMATED_TOKENS_PER_PAGE = 1000  # Rough Gemini input tokens per PDF page (image + text)
+PHASE1_TOKEN_BUDGET = 900_000  # Skip the two-file attempt above this estimate
+FINANCIAL_MIN_DIGITS = 40  # Fallback mapping: digits a page needs to count as a financial table
+FINANCIAL_DIGIT_RATIO = 0.15  # ...and the minimum share of its text that is digits
 
 # =============================================================================
 # DEFAULT PATHS (can be overridden via environment variables)
@@ -93,6 +132,8 @@ TOC_SCAN_PAGES = 30  # Number of pages to scan for TOC
 
 DEFAULT_FINANCIAL_REPORTS_DIR = Path(os.getenv("FINANCIAL_REPORTS_DIR", "./Financial_Reports"))
 DEFAULT_OUTPUT_DIR = Path(os.getenv("OUTPUT_DIR", "./All_Reports"))
+DEFAULT_CACHE_DIR = Path(os.getenv("CACHE_DIR", "./.report_cache"))
+MAX_CACHE_BYTES = 500 * 1024 * 1024  # Size budget per cache directory (LRU eviction)
 
 
 def validate_config() -> tuple[bool, list[str]]:
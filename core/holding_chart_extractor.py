@@ -11,25 +11,20 @@ in cut-off text and low accuracy.
 """
 
 import base64
+import html
 import io
 import json
 import logging
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
+import fitz  # PyMuPDF - renders pages in-process, no poppler subprocess
 from pydantic import BaseModel, Field
 
 logger = logging.getLogger(__name__)
 
 # Check for optional dependencies
-try:
-    from pdf2image import convert_from_bytes
-    from pdf2image.exceptions import PDFPageCountError, PDFSyntaxError
-    PDF2IMAGE_AVAILABLE = True
-except ImportError:
-    PDF2IMAGE_AVAILABLE = False
-    logger.warning("pdf2image not installed. Holding chart extraction disabled.")
-
 try:
     import google.generativeai as genai
     from PIL import Image
@@ -133,6 +128,13 @@ def _parse_llm_response(response_text: str) -> HoldingChartResult:
 # MAIN EXTRACTION FUNCTION
 # =============================================================================
 
+@lru_cache(maxsize=4)
+def _get_vision_model(google_api_key: str) -> "genai.GenerativeModel":
+    """Configure Gemini and build the vision model once per API key, not once per company."""
+    genai.configure(api_key=google_api_key)
+    return genai.GenerativeModel(VISION_MODEL)
+
+
 def extract_holding_chart_page(
     pdf_bytes: bytes,
     output_dir: Path,
@@ -158,10 +160,6 @@ def extract_holding_chart_page(
         Path to the saved chart image, or None if not found
     """
     # Check dependencies
-    if not PDF2IMAGE_AVAILABLE:
-        logger.error("pdf2image is required for holding chart extraction")
-        return None
-
     if not GEMINI_AVAILABLE:
         logger.error("google-generativeai is required for holding chart extraction")
         return None
@@ -170,33 +168,24 @@ def extract_holding_chart_page(
         logger.error("Google API key is required for holding chart extraction")
         return None
 
+    try:
+        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    except Exception as e:
+        logger.error(f"PDF is corrupted or encrypted: {e}")
+        return None
+
     try:
         # =====================================================================
-        # STEP 1: Fast Scan - Convert first N pages to low-res images
+        # STEP 1: Fast Scan - Render first N pages to low-res images
         # =====================================================================
         logger.info(f"Holding Chart: Scanning first {SCAN_PAGES_LIMIT} pages at {LOW_RES_DPI} DPI...")
 
         try:
-            # Convert PDF pages to images (in memory)
-            images = convert_from_bytes(
-                pdf_bytes,
-                dpi=LOW_RES_DPI,
-                fmt="jpeg",
-                first_page=1,
-                last_page=SCAN_PAGES_LIMIT,
-                thread_count=4
-            )
-        except PDFPageCountError:
-            logger.warning("PDF has fewer pages than scan limit, scanning all pages")
-            images = convert_from_bytes(
-                pdf_bytes,
-                dpi=LOW_RES_DPI,
-                fmt="jpeg",
-                thread_count=4
-            )
-        except PDFSyntaxError as e:
-            logger.error(f"PDF is corrupted or encrypted: {e}")
-            return None
+            # Render pages in memory (RGB, no alpha) and wrap the raw samples as PIL images
+            images = []
+            for page_index in range(min(SCAN_PAGES_LIMIT, doc.page_count)):
+                pix = doc[page_index].get_pixmap(dpi=LOW_RES_DPI, alpha=False)
+                images.append(Image.frombytes("RGB", (pix.width, pix.height), pix.samples))
         except Exception as e:
             logger.error(f"Failed to convert PDF to images: {e}")
             return None
@@ -212,9 +201,7 @@ def extract_holding_chart_page(
         # =====================================================================
         logger.info("Holding Chart: Analyzing pages with Gemini Vision...")
 
-        # Configure Gemini
-        genai.configure(api_key=google_api_key)
-        model = genai.GenerativeModel(VISION_MODEL)
+        model = _get_vision_model(google_api_key)
 
         # Prepare content with images and page labels
         content_parts = []
@@ -259,22 +246,11 @@ def extract_holding_chart_page(
         logger.info(f"Holding Chart: Extracting page {page_num} at {HIGH_RES_DPI} DPI...")
 
         try:
-            high_res_images = convert_from_bytes(
-                pdf_bytes,
-                dpi=HIGH_RES_DPI,
-                fmt="png",
-                first_page=page_num,
-                last_page=page_num,
-                thread_count=2
-            )
+            high_res_pix = doc[page_num - 1].get_pixmap(dpi=HIGH_RES_DPI, alpha=False)
         except Exception as e:
             logger.error(f"Failed to extract high-res page: {e}")
             return None
 
-        if not high_res_images:
-            logger.error("Failed to render high-res page")
-            return None
-
         # =====================================================================
         # STEP 5: Save the image
         # =====================================================================
@@ -287,7 +263,7 @@ def extract_holding_chart_page(
 
         output_path = output_dir / f"{safe_name}_holding_chart.png"
 
-        high_res_images[0].save(output_path, format="PNG", optimize=True)
+        high_res_pix.save(str(output_path))
 
         logger.info(f"Holding chart saved to: {output_path}")
 
@@ -297,6 +273,9 @@ def extract_holding_chart_page(
         logger.error(f"Unexpected error in holding chart extraction: {e}")
         return None
 
+    finally:
+        doc.close()
+
 
 def create_holding_chart_html(image_path: Optional[str], company_name: str) -> str:
     """
@@ -327,7 +306,7 @@ def create_holding_chart_html(image_path: Optional[str], company_name: str) -> s
     <h2>מבנה אחזקות</h2>
     <div class="holding-chart-container">
         <img src="data:image/png;base64,{image_data}"
-             alt="תרשים מבנה אחזקות - {company_name}"
+             alt="תרשים מבנה אחזקות - {html.escape(company_name)}"
              class="holding-chart-image" />
     </div>
 </div>
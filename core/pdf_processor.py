@@ -5,19 +5,61 @@ Handles all PyMuPDF (fitz) operations for PDF analysis and slicing.
 This module is stateless - all functions accept bytes and return bytes/data.
 """
 
+import re
 import json
 import logging
-from typing import Optional
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Iterator, Optional
 
 import fitz  # PyMuPDF
 import google.generativeai as genai
-
-from .config import HEAVY_REPORT_THRESHOLD, TOC_SCAN_PAGES
+from typing_extensions import TypedDict  # Gemini schema conversion needs it below Python 3.12
+
+from .config import (
+    HEAVY_REPORT_THRESHOLD,
+    TOC_SCAN_PAGES,
+    TOC_MIN_PAGE_CHARS,
+    TOC_MAX_CHARS,
+    FINANCIAL_MIN_DIGITS,
+    FINANCIAL_DIGIT_RATIO,
+)
 from .ai_engine import generate_with_retry
+from .cache import DiskCache, sha1_bytes, make_key
 from .prompts import get_structure_mapping_prompt
 
 logger = logging.getLogger(__name__)
 
+# PDF outline (bookmark) titles that mark where each part of the report starts
+OUTLINE_FINANCIAL_MARKERS = ("דוחות כספיים", "דוחות הכספיים", "financial statements")
+OUTLINE_NOTES_MARKERS = ("ביאורים", "notes to the")
+
+# Each marker set compiled into one case-insensitive alternation (single pass per title)
+_FINANCIAL_MARKER_RE = re.compile("|".join(map(re.escape, OUTLINE_FINANCIAL_MARKERS)), re.IGNORECASE)
+_NOTES_MARKER_RE = re.compile("|".join(map(re.escape, OUTLINE_NOTES_MARKERS)), re.IGNORECASE)
+
+# Plain text extraction only - never decode or emit image blocks
+_TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_IMAGES
+
+
+class PageRange(TypedDict):
+    start: int
+    end: int
+
+
+class StructureMap(TypedDict):
+    board_report: PageRange
+    financial_statements: PageRange
+    notes: PageRange
+
+
+# Structured output - Gemini returns exactly one StructureMap JSON object, no prose or fences
+_STRUCTURE_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": StructureMap,
+    "temperature": 0,
+}
+
 
 # =============================================================================
 # PDF ANALYSIS FUNCTIONS (Stateless - work with bytes)
@@ -71,24 +113,31 @@ def extract_toc_text(pdf_bytes: bytes, max_pages: int = TOC_SCAN_PAGES) -> str:
         Extracted text from TOC pages
     """
     try:
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        toc_text = []
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            return _extract_toc_text_from_doc(doc, max_pages)
+    except Exception as e:
+        logger.error(f"Error extracting TOC text: {e}")
+        return ""
 
-        pages_to_scan = min(max_pages, doc.page_count)
-        logger.info(f"  Extracting TOC text from first {pages_to_scan} pages...")
 
-        for i in range(pages_to_scan):
-            page = doc[i]
-            text = page.get_text()
-            if text:
-                toc_text.append(f"--- Page {i + 1} ---\n{text}")
+def _extract_toc_text_from_doc(doc: fitz.Document, max_pages: int) -> str:
+    """Collect the text of the first max_pages pages of an already opened document."""
+    toc_text = []
+    total_chars = 0
 
-        doc.close()
-        return "\n".join(toc_text)
+    pages_to_scan = min(max_pages, doc.page_count)
+    logger.info(f"  Extracting TOC text from first {pages_to_scan} pages...")
 
-    except Exception as e:
-        logger.error(f"Error extracting TOC text: {e}")
-        return ""
+    for i in range(pages_to_scan):
+        text = doc[i].get_text("text", flags=_TEXT_FLAGS)
+        # Skip image-heavy pages - they only add noise to the mapping prompt
+        if len(text.strip()) >= TOC_MIN_PAGE_CHARS:
+            toc_text.append(f"--- Page {i + 1} ---\n{text}")
+            total_chars += len(toc_text[-1]) + 1
+            if total_chars >= TOC_MAX_CHARS:
+                break  # The prompt keeps only TOC_MAX_CHARS - later pages would be cut anyway
+
+    return "\n".join(toc_text)
 
 
 # =============================================================================
@@ -112,46 +161,49 @@ def slice_pdf(
         New PDF content as bytes, or None if error
     """
     try:
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        total_pages = doc.page_count
-
-        start_page = max(0, start_page)
-        end_page = min(total_pages - 1, end_page)
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            return _slice_doc(doc, start_page, end_page)
+    except Exception as e:
+        logger.error(f"Error slicing PDF: {e}")
+        return None
 
-        if start_page > end_page:
-            logger.error(f"Invalid page range: {start_page} to {end_page}")
-            doc.close()
-            return None
 
-        new_doc = fitz.open()
-        new_doc.insert_pdf(doc, from_page=start_page, to_page=end_page)
+def _slice_doc(doc: fitz.Document, start_page: int, end_page: int) -> Optional[bytes]:
+    """Copy a page range of an already opened document into a new PDF (see slice_pdf)."""
+    total_pages = doc.page_count
 
-        # Get bytes from the new document
-        pdf_output = new_doc.tobytes()
+    start_page = max(0, start_page)
+    end_page = min(total_pages - 1, end_page)
 
-        new_doc.close()
-        doc.close()
+    if start_page > end_page:
+        logger.error(f"Invalid page range: {start_page} to {end_page}")
+        return None
 
-        pages_extracted = end_page - start_page + 1
-        logger.info(f"    Created slice: pages {start_page + 1}-{end_page + 1} ({pages_extracted} pages)")
+    with fitz.open() as new_doc:
+        # Annotations and links are never read by the model - don't copy them
+        new_doc.insert_pdf(doc, from_page=start_page, to_page=end_page, annots=False, links=False)
+        # Drop orphaned/duplicate objects and compress streams - smaller uploads.
+        # garbage=3 rather than 4: comparing stream contents is slow on large slices.
+        pdf_output = new_doc.tobytes(garbage=3, deflate=True, deflate_images=True)
 
-        return pdf_output
+    pages_extracted = end_page - start_page + 1
+    logger.info(f"    Created slice: pages {start_page + 1}-{end_page + 1} ({pages_extracted} pages)")
 
-    except Exception as e:
-        logger.error(f"Error slicing PDF: {e}")
-        return None
+    return pdf_output
 
 
 # =============================================================================
 # STRUCTURE MAPPING (AI-Powered)
 # =============================================================================
 
-def get_default_structure_map(total_pages: int) -> dict:
+def get_default_structure_map(total_pages: int, financial_start: Optional[int] = None) -> dict:
     """
     Return default page ranges based on typical Israeli financial report structure.
 
     Args:
         total_pages: Total number of pages in the PDF
+        financial_start: Detected first page of the financial statements (0-indexed),
+            used instead of the 25% guess when given
 
     Returns:
         Dictionary with page ranges for each section (0-indexed)
@@ -159,8 +211,10 @@ def get_default_structure_map(total_pages: int) -> dict:
     logger.info(f"  Using default structure mapping for {total_pages} pages")
 
     board_end = int(total_pages * 0.25)
-    financial_start = board_end
-    financial_end = int(total_pages * 0.60)
+    if financial_start is None:
+        financial_start = board_end
+    board_end = min(board_end, financial_start)
+    financial_end = max(int(total_pages * 0.60), financial_start)
     notes_start = financial_end
 
     structure = {
@@ -175,19 +229,112 @@ def get_default_structure_map(total_pages: int) -> dict:
     return structure
 
 
+def find_financial_start_by_density(doc: fitz.Document, from_page: int) -> Optional[int]:
+    """
+    Locate the first financial statements page from the share of digits in its text.
+
+    Balance sheet and P&L pages are dominated by figures, so the first page from
+    from_page onward that is dense in digits is a far tighter anchor than a fixed
+    percentage when neither the outline nor the AI mapping is available.
+
+    Args:
+        doc: Opened PDF document
+        from_page: First page index to examine (0-indexed)
+
+    Returns:
+        Page index (0-indexed), or None if no page looks like a financial table
+    """
+    for page_index in range(max(0, from_page), doc.page_count):
+        text = doc[page_index].get_text("text", flags=_TEXT_FLAGS)
+        digits = sum(map(str.isdigit, text))
+        if digits >= FINANCIAL_MIN_DIGITS and digits / len(text) >= FINANCIAL_DIGIT_RATIO:
+            return page_index
+    return None
+
+
+def _fallback_structure_map(pdf_bytes: bytes, total_pages: int) -> dict:
+    """Default ranges, anchored on the first digit-dense page past mid-report when one exists."""
+    try:
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            financial_start = find_financial_start_by_density(doc, total_pages // 2)
+    except Exception as e:
+        logger.warning(f"  Numeric density scan failed: {e}")
+        financial_start = None
+
+    if financial_start is not None:
+        logger.info(f"  Financial tables detected from page {financial_start + 1} (numeric density)")
+    return get_default_structure_map(total_pages, financial_start)
+
+
+def map_structure_from_outline(doc: fitz.Document) -> Optional[dict]:
+    """
+    Derive section page ranges from the PDF's embedded outline (bookmarks).
+
+    Many annual reports ship a bookmark tree that already points at the
+    financial statements and notes, which makes the AI mapping call unnecessary.
+
+    Args:
+        doc: Open PyMuPDF document
+
+    Returns:
+        Dictionary with page ranges (0-indexed), or None if the outline
+        is missing or does not locate both the statements and the notes
+    """
+    total_pages = doc.page_count
+    outline = [
+        (level, title, page - 1)
+        for level, title, page in doc.get_toc(simple=True)
+        if 1 <= page <= total_pages
+    ]
+
+    # Prefer the shallowest matching entry - deeper ones are often sub-topics
+    # of the board report that merely mention the financial statements
+    financial_entries = [
+        (level, page) for level, title, page in outline
+        if _FINANCIAL_MARKER_RE.search(title)
+    ]
+    if not financial_entries:
+        return None
+    financial_level, financial_start = min(financial_entries)
+
+    notes_start = next(
+        (page for level, title, page in outline
+         if page > financial_start and _NOTES_MARKER_RE.search(title)),
+        None
+    )
+    if notes_start is None or financial_start == 0:
+        return None
+
+    # Notes run until the next part of the report at the statements' level (if any)
+    notes_end = next(
+        (page - 1 for level, title, page in outline
+         if page > notes_start and level <= financial_level),
+        total_pages - 1
+    )
+
+    return {
+        'board_report': {'start': 0, 'end': financial_start - 1},
+        'financial_statements': {'start': financial_start, 'end': notes_start - 1},
+        'notes': {'start': notes_start, 'end': notes_end}
+    }
+
+
 def map_report_structure(
     pdf_bytes: bytes,
     model: genai.GenerativeModel,
-    filename: str = "report.pdf"
+    filename: str = "report.pdf",
+    cache: Optional[DiskCache] = None
 ) -> dict:
     """
-    Use AI (gemini-3-pro-preview) to analyze TOC and identify page ranges for report sections.
+    Use AI (STRUCTURE_MODEL_NAME, a Flash model) to analyze TOC and identify page ranges for report sections.
     Uses generate_with_retry for robust error handling.
 
     Args:
         pdf_bytes: PDF file content as bytes
-        model: Gemini model instance
+        model: Gemini model instance (normally get_structure_model())
         filename: Original filename for logging
+        cache: Optional disk cache - responses are keyed by (model, prompt), so a
+            re-run on the same TOC replays the earlier mapping without an API call
 
     Returns:
         Dictionary with page ranges (0-indexed):
@@ -197,58 +344,62 @@ def map_report_structure(
             'notes': {'start': int, 'end': int}
         }
 
-        Falls back to default percentage-based ranges if AI mapping fails.
+        Falls back to default ranges (anchored on the first digit-dense page) if AI mapping fails.
     """
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    total_pages = doc.page_count
-    doc.close()
-
-    logger.info(f"  Running AI-powered structure mapping on {filename}...")
-
-    # Extract TOC text from first pages
-    toc_text = extract_toc_text(pdf_bytes, max_pages=TOC_SCAN_PAGES)
+    # One open serves both the outline lookup and the TOC text extraction
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        total_pages = doc.page_count
+        try:
+            outline_map = map_structure_from_outline(doc)
+        except Exception as e:
+            logger.warning(f"  Could not read PDF outline: {e}")
+            outline_map = None
+
+        # Fast path: the embedded outline already locates every section
+        if outline_map:
+            for section, ranges in outline_map.items():
+                logger.info(f"    {section}: pages {ranges['start'] + 1}-{ranges['end'] + 1}")
+            logger.info("  ✓ Structure mapped from PDF outline (AI mapping skipped)")
+            return outline_map
+
+        logger.info(f"  Running AI-powered structure mapping on {filename}...")
+
+        # Extract TOC text from first pages
+        try:
+            toc_text = _extract_toc_text_from_doc(doc, TOC_SCAN_PAGES)
+        except Exception as e:
+            logger.error(f"Error extracting TOC text: {e}")
+            toc_text = ""
 
     if not toc_text:
         logger.warning("  Could not extract TOC text, using fallback ranges")
-        return get_default_structure_map(total_pages)
+        return _fallback_structure_map(pdf_bytes, total_pages)
 
     # Get the prompt for structure mapping
     prompt = get_structure_mapping_prompt(total_pages, toc_text)
 
-    # Use retry wrapper for the API call
-    response_text = generate_with_retry(
-        prompt=prompt,
-        model=model,
-        operation_name="Structure Mapping"
-    )
+    cache_key = make_key("structure", model.model_name, prompt) if cache else None
+    cached_response = cache.get(cache_key) if cache is not None else None
+
+    if cached_response is not None:
+        logger.info("  Reusing cached structure mapping response")
+        response_text = cached_response.decode("utf-8")
+    else:
+        # Use retry wrapper for the API call
+        response_text = generate_with_retry(
+            prompt=prompt,
+            model=model,
+            operation_name="Structure Mapping",
+            generation_config=_STRUCTURE_GENERATION_CONFIG
+        )
 
     if not response_text:
         logger.warning("  AI mapping returned no response, using fallback ranges")
-        return get_default_structure_map(total_pages)
+        return _fallback_structure_map(pdf_bytes, total_pages)
 
-    # Parse JSON response
+    # Parse JSON response (JSON mode - no markdown or prose to strip)
     try:
-        # Clean up response - remove any markdown or extra text
-        clean_response = response_text.strip()
-
-        # Remove markdown code blocks if present
-        if '```' in clean_response:
-            parts = clean_response.split('```')
-            for part in parts:
-                part = part.strip()
-                if part.startswith('json'):
-                    part = part[4:].strip()
-                if part.startswith('{') and part.endswith('}'):
-                    clean_response = part
-                    break
-
-        # Find the JSON object in the response
-        start_idx = clean_response.find('{')
-        end_idx = clean_response.rfind('}') + 1
-        if start_idx != -1 and end_idx > start_idx:
-            clean_response = clean_response[start_idx:end_idx]
-
-        structure_map = json.loads(clean_response)
+        structure_map = json.loads(response_text)
 
         # Validate and convert to 0-indexed
         validated_map = {}
@@ -267,21 +418,26 @@ def map_report_structure(
             if section not in validated_map:
                 validated_map[section] = default_map[section]
 
+        # Only responses that parsed into a map are worth replaying
+        if cache is not None and cached_response is None:
+            cache.set(cache_key, response_text.encode("utf-8"))
+
         logger.info("  ✓ AI structure mapping completed")
         return validated_map
 
     except json.JSONDecodeError as e:
         logger.warning(f"  Failed to parse AI response as JSON: {e}")
         logger.warning(f"  Response was: {response_text[:300]}...")
-        return get_default_structure_map(total_pages)
+        return _fallback_structure_map(pdf_bytes, total_pages)
     except Exception as e:
         logger.warning(f"  AI mapping parsing failed: {e}")
-        return get_default_structure_map(total_pages)
+        return _fallback_structure_map(pdf_bytes, total_pages)
 
 
 def create_report_slices(
     pdf_bytes: bytes,
-    structure_map: dict
+    structure_map: dict,
+    cache: Optional[DiskCache] = None
 ) -> dict[str, Optional[bytes]]:
     """
     Create sliced PDFs based on the structure map.
@@ -289,6 +445,8 @@ def create_report_slices(
     Args:
         pdf_bytes: Source PDF content as bytes
         structure_map: Dictionary with page ranges
+        cache: Optional disk cache - slices are keyed by (source hash, page range)
+            so re-runs on an unchanged PDF skip re-slicing
 
     Returns:
         Dictionary with slice names and their bytes:
@@ -298,25 +456,102 @@ def create_report_slices(
         }
     """
     slices = {}
+    pdf_hash = sha1_bytes(pdf_bytes) if cache else None
+    source_doc = None  # Opened on the first cache miss, shared by both slices
+
+    def _slice(start_page: int, end_page: int) -> Optional[bytes]:
+        nonlocal source_doc
+
+        key = make_key("slice", pdf_hash, start_page, end_page) if cache else None
+        if cache is not None:
+            slice_bytes = cache.get(key)
+            if slice_bytes is not None:
+                logger.info(f"    Reusing cached slice: pages {start_page + 1}-{end_page + 1}")
+                return slice_bytes
+
+        try:
+            if source_doc is None:
+                source_doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+            slice_bytes = _slice_doc(source_doc, start_page, end_page)
+        except Exception as e:
+            logger.error(f"Error slicing PDF: {e}")
+            return None
 
-    # Create board report slice
-    board_range = structure_map.get('board_report', {})
-    if board_range:
-        slices['board_slice'] = slice_pdf(
-            pdf_bytes, board_range['start'], board_range['end']
-        )
+        if cache is not None and slice_bytes is not None:
+            cache.set(key, slice_bytes)
+        return slice_bytes
 
-    # Create financial slice (financial_statements + notes combined)
-    fin_range = structure_map.get('financial_statements', {})
-    notes_range = structure_map.get('notes', {})
-
-    if fin_range and notes_range:
-        start = fin_range['start']
-        end = notes_range['end']
-        slices['financial_slice'] = slice_pdf(pdf_bytes, start, end)
-    elif fin_range:
-        slices['financial_slice'] = slice_pdf(
-            pdf_bytes, fin_range['start'], fin_range['end']
-        )
+    try:
+        # Create board report slice
+        board_range = structure_map.get('board_report', {})
+        if board_range:
+            slices['board_slice'] = _slice(board_range['start'], board_range['end'])
+
+        # Create financial slice (financial_statements + notes combined)
+        fin_range = structure_map.get('financial_statements', {})
+        notes_range = structure_map.get('notes', {})
+
+        if fin_range and notes_range:
+            start = fin_range['start']
+            end = notes_range['end']
+            slices['financial_slice'] = _slice(start, end)
+        elif fin_range:
+            slices['financial_slice'] = _slice(fin_range['start'], fin_range['end'])
+    finally:
+        if source_doc is not None:
+            source_doc.close()
 
     return slices
+
+
+@contextmanager
+def shared_pdf_buffer(pdf_bytes: bytes) -> Iterator[str]:
+    """
+    Copy PDF bytes into a shared memory block for worker processes.
+
+    Passing the name instead of the bytes saves pickling the whole PDF
+    (often 50-200 MB) through the process pool's pipe.
+
+    Args:
+        pdf_bytes: Source PDF content as bytes
+
+    Yields:
+        The shared memory block name (see create_report_slices_from_shm)
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(len(pdf_bytes), 1))
+    try:
+        shm.buf[:len(pdf_bytes)] = pdf_bytes
+        yield shm.name
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def create_report_slices_from_shm(
+    shm_name: str,
+    size: int,
+    structure_map: dict,
+    cache: Optional[DiskCache] = None
+) -> dict[str, Optional[bytes]]:
+    """
+    Process-pool entry point for create_report_slices reading the source PDF
+    from a block created by shared_pdf_buffer (zero-copy on the worker side).
+
+    Args:
+        shm_name: Shared memory block name
+        size: Length of the PDF inside the block
+        structure_map: Dictionary with page ranges
+        cache: Optional disk cache (see create_report_slices)
+
+    Returns:
+        Same as create_report_slices
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        view = shm.buf[:size]
+        try:
+            return create_report_slices(view, structure_map, cache)
+        finally:
+            view.release()
+    finally:
+        shm.close()
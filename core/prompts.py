@@ -4,6 +4,8 @@ Prompts module for Financial Reports Service.
 Contains all AI prompts used for report analysis and generation.
 """
 
+from .config import TOC_MAX_CHARS
+
 
 def get_structure_mapping_prompt(total_pages: int, toc_text: str) -> str:
     """
@@ -33,4 +35,4 @@ Page numbers should be 1-indexed (first page = 1).
 Analyze carefully and provide accurate page ranges based on the TOC below.
 
 TOC TEXT:
-{toc_text[:12000]}"""
+{toc_text[:TOC_MAX_CHARS]}"""
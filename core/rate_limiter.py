@@ -0,0 +1,130 @@
+"""
+Rate Limiter module for Financial Reports Service.
+
+Proactive client-side throttling for the Supabase Edge Function and Gemini
+upload endpoints. Instead of firing requests and backing off after a 429,
+callers reserve a token first and wait only as long as needed for it to refill.
+A circuit breaker makes callers fail fast while the endpoint is down.
+"""
+
+import time
+import threading
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by all in-flight requests to one endpoint.
+
+    Args:
+        rate: Tokens refilled per second (sustained request rate)
+        capacity: Maximum tokens held (burst size)
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        """Add the tokens accrued since the last refill (caller holds the lock)."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self, n: float = 1) -> float:
+        """
+        Reserve n tokens, sleeping until they are available.
+
+        The reservation is made under the lock (tokens may go negative), so
+        concurrent callers queue up behind each other instead of racing.
+
+        Args:
+            n: Number of tokens to reserve
+
+        Returns:
+            Seconds spent waiting
+        """
+        with self._lock:
+            self._refill()
+            self.tokens -= n
+            wait_time = -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+        if wait_time > 0:
+            time.sleep(wait_time)
+        return wait_time
+
+    def try_acquire(self, max_wait: float, n: float = 1) -> bool:
+        """
+        Like acquire, but reserve nothing if the wait would exceed max_wait.
+
+        Args:
+            max_wait: Longest acceptable wait in seconds
+            n: Number of tokens to reserve
+
+        Returns:
+            True if the tokens were reserved (after any wait), False otherwise
+        """
+        with self._lock:
+            self._refill()
+            wait_time = (n - self.tokens) / self.rate if self.tokens < n else 0.0
+            if wait_time > max_wait:
+                return False
+            self.tokens -= n
+
+        if wait_time > 0:
+            time.sleep(wait_time)
+        return True
+
+    def penalize(self) -> None:
+        """Empty the bucket after a 429 so the next callers back off."""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0) - 1
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker shared by all requests to one endpoint.
+
+    After `threshold` consecutive failures the circuit opens for `cooldown`
+    seconds; while open, callers give up immediately instead of each sitting
+    through its own retry backoff against an endpoint that is down.
+
+    Args:
+        threshold: Consecutive failures that open the circuit
+        cooldown: Seconds the circuit stays open
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        """True while calls should fail fast."""
+        with self._lock:
+            return time.monotonic() < self.open_until
+
+    def record_success(self) -> None:
+        """Reset the consecutive-failure count."""
+        with self._lock:
+            self.failures = 0
+
+    def record_failure(self) -> bool:
+        """
+        Count a failure, opening the circuit once the threshold is reached.
+
+        Returns:
+            True if this failure opened the circuit
+        """
+        with self._lock:
+            self.failures += 1
+            if self.failures < self.threshold:
+                return False
+            self.failures = 0
+            self.open_until = time.monotonic() + self.cooldown
+            return True
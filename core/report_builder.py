@@ -4,7 +4,9 @@ Professional Design Edition - WeasyPrint Optimized.
 Uses @page:first for cover, standard margins for content.
 """
 
+import html
 import time
+from functools import lru_cache
 from typing import List
 
 HEBREW_MONTHS = [
@@ -12,68 +14,56 @@ HEBREW_MONTHS = [
     'יולי', 'אוגוסט', 'ספטמבר', 'אוקטובר', 'נובמבר', 'דצמבר'
 ]
 
-def get_html_template(company_name: str, timestamp: str = None) -> str:
-    """
-    Generate the HTML header optimized for WeasyPrint PDF rendering.
-    """
-    # Replace underscores with spaces for display
-    display_name = company_name.replace('_', ' ')
-
-    if timestamp is None:
-        month_idx = int(time.strftime('%m')) - 1
-        year = time.strftime('%Y')
-        timestamp = f"{HEBREW_MONTHS[month_idx]} {year}"
-
-    return f"""<!DOCTYPE html>
+# Static document head (styles only) - built once at import time
+_HTML_HEAD = """<!DOCTYPE html>
 <html dir="rtl" lang="he">
 <head>
     <meta charset="UTF-8">
-    <title>דוח אנליזה - {company_name}</title>
     <style>
         @import url('https://fonts.googleapis.com/css2?family=Assistant:wght@300;400;600&family=Heebo:wght@400;700&display=swap');
 
-        :root {{
+        :root {
             --primary: #0f2b46;
             --accent: #c5a47e;
             --text: #2d3748;
             --bg-gray: #f7fafc;
             --border: #e2e8f0;
-        }}
+        }
 
         /* --- Page Rules for WeasyPrint --- */
 
         /* First page (cover): zero margins for full bleed */
-        @page:first {{
+        @page:first {
             size: A4;
             margin: 0;
-        }}
+        }
 
         /* All other pages: standard margins */
-        @page {{
+        @page {
             size: A4;
             margin: 25mm 20mm 25mm 20mm;
-        }}
+        }
 
-        * {{
+        * {
             box-sizing: border-box;
-        }}
+        }
 
-        body {{
+        body {
             font-family: 'Assistant', sans-serif;
             color: var(--text);
             line-height: 1.6;
             margin: 0;
             padding: 0;
             background-color: white;
-        }}
+        }
 
         /* --- Typography --- */
-        h1 {{
+        h1 {
             font-family: 'Heebo', sans-serif;
             color: var(--primary);
-        }}
+        }
 
-        h2 {{
+        h2 {
             font-family: 'Heebo', sans-serif;
             color: var(--primary);
             font-size: 22px;
@@ -84,28 +74,28 @@ def get_html_template(company_name: str, timestamp: str = None) -> str:
             page-break-before: always;
             margin-top: 0;
             padding-top: 10px;
-        }}
+        }
 
-        h3 {{
+        h3 {
             font-family: 'Heebo', sans-serif;
             color: var(--primary);
             font-size: 18px;
             margin-top: 30px;
             page-break-after: avoid;
-        }}
+        }
 
-        p {{
+        p {
             margin-bottom: 15px;
             text-align: justify;
-        }}
+        }
 
-        ul, ol {{
+        ul, ol {
             margin-bottom: 15px;
             padding-right: 20px;
-        }}
+        }
 
         /* --- Cover Page (Full Bleed) --- */
-        .cover-page {{
+        .cover-page {
             /* Fill the entire first page */
             width: 210mm;
             height: 297mm;
@@ -119,9 +109,9 @@ def get_html_template(company_name: str, timestamp: str = None) -> str:
             /* Force page break after */
             page-break-after: always;
             break-after: page;
-        }}
+        }
 
-        .cover-inner {{
+        .cover-inner {
             /* Inner container for centering content */
             width: 100%;
             height: 100%;
@@ -131,9 +121,9 @@ def get_html_template(company_name: str, timestamp: str = None) -> str:
             align-items: center;
             text-align: center;
             padding: 40mm;
-        }}
+        }
 
-        .cover-title h1 {{
+        .cover-title h1 {
             font-family: 'Heebo', sans-serif;
             font-size: 48px;
             margin: 0 0 25px 0;
@@ -141,71 +131,71 @@ def get_html_template(company_name: str, timestamp: str = None) -> str:
             color: white;
             border: none;
             padding: 0;
-        }}
+        }
 
-        .cover-subtitle {{
+        .cover-subtitle {
             font-family: 'Heebo', sans-serif;
             font-size: 26px;
             color: var(--accent);
             font-weight: 300;
             letter-spacing: 1px;
-        }}
+        }
 
         /* --- Tables --- */
-        table {{
+        table {
             width: 100%;
             border-collapse: collapse;
             margin: 25px 0;
             font-size: 13px;
             page-break-inside: auto;
-        }}
+        }
 
-        tr {{
+        tr {
             page-break-inside: avoid;
             page-break-after: auto;
-        }}
+        }
 
-        th {{
+        th {
             background-color: var(--primary);
             color: white;
             font-weight: 600;
             text-align: right;
             padding: 10px;
-        }}
+        }
 
-        td {{
+        td {
             padding: 8px 10px;
             border-bottom: 1px solid var(--border);
-        }}
+        }
 
-        tr:nth-child(even) {{
+        tr:nth-child(even) {
             background-color: var(--bg-gray);
-        }}
+        }
 
         /* --- Error Section --- */
-        .error {{
+        .error {
             border: 1px solid #e53e3e;
             background: #fff5f5;
             color: #c53030;
             padding: 15px;
             margin: 20px 0;
             page-break-inside: avoid;
-        }}
+        }
 
         /* --- Holding Chart Section --- */
-        .holding-chart-section {{
+        .holding-chart-section {
             page-break-inside: avoid;
             break-inside: avoid;
-        }}
+        }
 
-        .holding-chart-section h2 {{
+        .holding-chart-section h2 {
             /* Override: don't break before h2 in this section */
             break-before: auto;
             page-break-before: auto;
             margin-bottom: 15px;
-        }}
+        }
 
-        .holding-chart-container {{
+        .holding-chart-container {
             page-break-inside: avoid;
             break-inside: avoid;
             margin: 10px 0;
@@ -214,9 +204,9 @@ def get_html_template(company_name: str, timestamp: str = None) -> str:
             border: 1px solid var(--border);
             border-radius: 4px;
             text-align: center;
-        }}
+        }
 
-        .holding-chart-image {{
+        .holding-chart-image {
             max-width: 100%;
             /* Fit image within page height minus header and margins */
             max-height: 200mm;
@@ -224,14 +214,46 @@ def get_html_template(company_name: str, timestamp: str = None) -> str:
             height: auto;
             display: block;
             margin: 0 auto;
-        }}
+        }
 
         /* --- Print Adjustments --- */
-        @media print {{
-            body {{ background: white; }}
-            a {{ text-decoration: none; color: inherit; }}
-        }}
+        @media print {
+            body { background: white; }
+            a { text-decoration: none; color: inherit; }
+        }
     </style>
+"""
+
+_HTML_FOOTER = """
+</div>
+
+<div style="text-align: center; color: #718096; font-size: 10px; margin-top: 50px; border-top: 1px solid #e2e8f0; padding-top: 10px;">
+    דוח זה הופק אוטומטית ע"י מערכת AI. המידע המוצג הינו למטרות ניתוח בלבד.
+</div>
+</body>
+</html>
+"""
+
+def _current_timestamp() -> str:
+    """
+    Return the current Hebrew month and year for the cover page.
+    """
+    month_idx = int(time.strftime('%m')) - 1
+    year = time.strftime('%Y')
+    return f"{HEBREW_MONTHS[month_idx]} {year}"
+
+@lru_cache(maxsize=256)
+def _render_cover(company_name: str, timestamp: str) -> str:
+    """
+    Generate the per-company part of the header (title + cover page).
+    Memoized - reruns for the same company and month reuse the string.
+    """
+    # Company names come from directory names / API requests - never raw HTML
+    safe_name = html.escape(company_name)
+    # Replace underscores with spaces for display
+    display_name = safe_name.replace('_', ' ')
+
+    return f"""    <title>דוח אנליזה - {safe_name}</title>
 </head>
 <body>
 
@@ -247,28 +269,31 @@ def get_html_template(company_name: str, timestamp: str = None) -> str:
 <div class="content">
 """
 
+def get_html_template(company_name: str, timestamp: str = None) -> str:
+    """
+    Generate the HTML header optimized for WeasyPrint PDF rendering.
+    """
+    return _HTML_HEAD + _render_cover(company_name, timestamp or _current_timestamp())
+
 def get_html_footer() -> str:
     """
     Generate the HTML footer.
     """
-    return """
-</div>
-
-<div style="text-align: center; color: #718096; font-size: 10px; margin-top: 50px; border-top: 1px solid #e2e8f0; padding-top: 10px;">
-    דוח זה הופק אוטומטית ע"י מערכת AI. המידע המוצג הינו למטרות ניתוח בלבד.
-</div>
-</body>
-</html>
-"""
+    return _HTML_FOOTER
 
 def assemble_report(company_name: str, sections_html: List[str], timestamp: str = None) -> str:
     """
     Assemble a complete HTML report from sections.
     """
-    html = get_html_template(company_name, timestamp)
-    html += "\n".join(sections_html)
-    html += get_html_footer()
-    return html
+    # One join over a flat list - section HTML (the bulk of the report) is
+    # copied once instead of first into an inner "\n".join and then again
+    parts = [_HTML_HEAD, _render_cover(company_name, timestamp or _current_timestamp())]
+    for i, section_html in enumerate(sections_html):
+        if i:
+            parts.append("\n")
+        parts.append(section_html)
+    parts.append(_HTML_FOOTER)
+    return "".join(parts)
 
 def create_error_section(section_id: str, display_name: str, error_type: str = "general") -> str:
     """
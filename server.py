@@ -17,9 +17,11 @@ Usage:
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from pydantic import BaseModel, HttpUrl
 from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
 import logging
+import multiprocessing
 import httpx
-import time
 import os
 
 import tempfile
@@ -32,15 +34,20 @@ from core import (
     SECTION_DISPLAY_NAMES,
     MODEL_NAME,
     GOOGLE_API_KEY,
-    API_DELAY,
+    MAX_PDF_WORKERS,
     validate_config,
     HEBREW_MONTHS,
     configure_gemini,
+    get_structure_model,
     upload_pdf_to_gemini,
-    generate_section_with_fallback,
+    upload_pdfs_to_gemini,
+    generate_sections,
+    is_section_ok,
     is_heavy_report,
+    get_pdf_page_count,
     map_report_structure,
-    create_report_slices,
+    shared_pdf_buffer,
+    create_report_slices_from_shm,
     assemble_report,
     html_to_pdf,
     extract_holding_chart_page,
@@ -77,9 +84,17 @@ app = FastAPI(
 # Global model instance
 _model = None
 
+# Worker processes for PDF slicing - PyMuPDF holds the GIL, so slicing in a
+# thread would still stall the event loop for every other request
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+
 # HTTP client timeout (seconds)
 DOWNLOAD_TIMEOUT = 120
 
+# One client for all Supabase and PDF-download requests, so keep-alive
+# connections are reused instead of a new TCP+TLS handshake per call
+_http_client: Optional[httpx.AsyncClient] = None
+
 
 # =============================================================================
 # PYDANTIC MODELS
@@ -117,23 +132,22 @@ async def update_report_status(report_id: str, status: str, failure_reason: Opti
         return
 
     try:
-        async with httpx.AsyncClient() as client:
-            data = {"status": status}
-            if failure_reason:
-                data["failure_reason"] = failure_reason
-
-            response = await client.patch(
-                f"{SUPABASE_URL}/rest/v1/{SUPABASE_TABLE}?id=eq.{report_id}",
-                json=data,
-                headers={
-                    "apikey": SUPABASE_SERVICE_KEY,
-                    "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-                    "Content-Type": "application/json",
-                    "Prefer": "return=minimal"
-                }
-            )
-            response.raise_for_status()
-            logger.info(f"Updated report {report_id} status to: {status}")
+        data = {"status": status}
+        if failure_reason:
+            data["failure_reason"] = failure_reason
+
+        response = await _http_client.patch(
+            f"{SUPABASE_URL}/rest/v1/{SUPABASE_TABLE}?id=eq.{report_id}",
+            json=data,
+            headers={
+                "apikey": SUPABASE_SERVICE_KEY,
+                "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
+                "Content-Type": "application/json",
+                "Prefer": "return=minimal"
+            }
+        )
+        response.raise_for_status()
+        logger.info(f"Updated report {report_id} status to: {status}")
 
     except Exception as e:
         logger.error(f"Failed to update report status: {e}")
@@ -148,23 +162,22 @@ async def upload_to_supabase(report_id: str, filename: str, content: bytes, cont
     try:
         file_path = f"{report_id}/{filename}"
 
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{SUPABASE_URL}/storage/v1/object/{SUPABASE_BUCKET}/{file_path}",
-                content=content,
-                headers={
-                    "apikey": SUPABASE_SERVICE_KEY,
-                    "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-                    "Content-Type": content_type,
-                    "x-upsert": "true"  # Overwrite if exists
-                }
-            )
-            response.raise_for_status()
+        response = await _http_client.post(
+            f"{SUPABASE_URL}/storage/v1/object/{SUPABASE_BUCKET}/{file_path}",
+            content=content,
+            headers={
+                "apikey": SUPABASE_SERVICE_KEY,
+                "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
+                "Content-Type": content_type,
+                "x-upsert": "true"  # Overwrite if exists
+            }
+        )
+        response.raise_for_status()
 
-            # Return public URL
-            public_url = f"{SUPABASE_URL}/storage/v1/object/public/{SUPABASE_BUCKET}/{file_path}"
-            logger.info(f"Uploaded {filename} to Supabase: {public_url}")
-            return public_url
+        # Return public URL
+        public_url = f"{SUPABASE_URL}/storage/v1/object/public/{SUPABASE_BUCKET}/{file_path}"
+        logger.info(f"Uploaded {filename} to Supabase: {public_url}")
+        return public_url
 
     except Exception as e:
         logger.error(f"Failed to upload to Supabase: {e}")
@@ -180,11 +193,10 @@ async def download_pdf(url: str) -> bytes:
     logger.info(f"Downloading PDF from: {url}")
 
     try:
-        async with httpx.AsyncClient(timeout=DOWNLOAD_TIMEOUT) as client:
-            response = await client.get(str(url))
-            response.raise_for_status()
-            logger.info(f"Downloaded {len(response.content):,} bytes")
-            return response.content
+        response = await _http_client.get(str(url), timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        logger.info(f"Downloaded {len(response.content):,} bytes")
+        return response.content
 
     except httpx.TimeoutException:
         raise Exception(f"Timeout downloading PDF from {url}")
@@ -206,6 +218,11 @@ def get_filename_from_url(url: str) -> str:
 async def process_report_async(request: GenerateReportRequest):
     """
     Background task to process report and upload to Supabase.
+
+    The core pipeline is synchronous (PyMuPDF work and blocking Gemini/Edge
+    Function calls), so each slow step runs in a worker thread via
+    asyncio.to_thread - the event loop keeps serving other requests meanwhile.
+    PDF slicing, the CPU-heavy step, runs in the _pdf_pool worker processes.
     """
     report_id = request.report_id
     company_name = request.company_name
@@ -218,52 +235,88 @@ async def process_report_async(request: GenerateReportRequest):
 
         # Step 1: Download PDFs
         logger.info("Step 1: Downloading PDFs...")
-        annual_bytes = await download_pdf(str(request.annual_report_url))
         annual_filename = get_filename_from_url(str(request.annual_report_url))
 
         quarterly_bytes = None
         if request.quarterly_report_url:
-            quarterly_bytes = await download_pdf(str(request.quarterly_report_url))
+            # Independent downloads - fetch both at once
+            annual_bytes, quarterly_bytes = await asyncio.gather(
+                download_pdf(str(request.annual_report_url)),
+                download_pdf(str(request.quarterly_report_url))
+            )
+        else:
+            annual_bytes = await download_pdf(str(request.annual_report_url))
 
         # Step 2: Check if heavy report
         logger.info("Step 2: Checking report size...")
-        is_heavy, total_pages = is_heavy_report(annual_bytes)
+        is_heavy, total_pages = await asyncio.to_thread(is_heavy_report, annual_bytes)
 
-        board_uri = None
-        financial_uri = None
+        page_counts = {}  # File URI -> page count, for the Phase 1 token preflight
 
         # Step 3: Process based on report size
+        upload_jobs = {}  # Tag -> (pdf_bytes, display_name), uploaded concurrently
+        board_slice_bytes = None
+        financial_slice_bytes = None
+
         if is_heavy:
             logger.warning(f"⚠️  HEAVY REPORT ({total_pages} pages)")
             logger.info("Step 3: Mapping structure and creating slices...")
 
-            structure_map = map_report_structure(annual_bytes, _model, annual_filename)
-            slices = create_report_slices(annual_bytes, structure_map)
+            structure_map = await asyncio.to_thread(
+                map_report_structure, annual_bytes, get_structure_model(), annual_filename
+            )
+            with shared_pdf_buffer(annual_bytes) as shm_name:
+                slices = await asyncio.get_running_loop().run_in_executor(
+                    _pdf_pool, create_report_slices_from_shm,
+                    shm_name, len(annual_bytes), structure_map
+                )
 
             board_slice_bytes = slices.get('board_slice')
             financial_slice_bytes = slices.get('financial_slice')
 
             if board_slice_bytes:
-                board_uri = upload_pdf_to_gemini(board_slice_bytes, f"board_{annual_filename}")
+                upload_jobs['board'] = (board_slice_bytes, f"board_{annual_filename}")
             if financial_slice_bytes:
-                financial_uri = upload_pdf_to_gemini(financial_slice_bytes, f"financial_{annual_filename}")
-
-            if not board_uri and not financial_uri:
+                upload_jobs['financial'] = (financial_slice_bytes, f"financial_{annual_filename}")
+            if not upload_jobs:
                 logger.warning("Slicing failed, falling back to standard processing")
                 is_heavy = False
 
         if not is_heavy:
             logger.info(f"Step 3: Standard report ({total_pages} pages), uploading...")
-            primary_uri = upload_pdf_to_gemini(annual_bytes, annual_filename)
+            upload_jobs['annual'] = (annual_bytes, annual_filename)
+
+        # Upload quarterly (if provided) alongside the annual files
+        if quarterly_bytes:
+            upload_jobs['quarterly'] = (quarterly_bytes, "quarterly_report.pdf")
+
+        uris = await asyncio.to_thread(upload_pdfs_to_gemini, upload_jobs)
+        board_uri = uris.get('board')
+        financial_uri = uris.get('financial')
+        quarterly_uri = uris.get('quarterly')
+
+        # Counting pages parses the PDF with PyMuPDF (holds the GIL) - off the event loop
+        if board_uri:
+            page_counts[board_uri] = await asyncio.to_thread(get_pdf_page_count, board_slice_bytes)
+        if financial_uri:
+            page_counts[financial_uri] = await asyncio.to_thread(
+                get_pdf_page_count, financial_slice_bytes
+            )
+        if quarterly_uri:
+            page_counts[quarterly_uri] = await asyncio.to_thread(get_pdf_page_count, quarterly_bytes)
+
+        if is_heavy and not board_uri and not financial_uri:
+            logger.warning("Slice uploads failed, falling back to standard processing")
+            is_heavy = False
+            uris['annual'] = await asyncio.to_thread(upload_pdf_to_gemini, annual_bytes, annual_filename)
+
+        if not is_heavy:
+            primary_uri = uris.get('annual')
             if not primary_uri:
                 raise Exception("Failed to upload PDF to Gemini")
             board_uri = primary_uri
             financial_uri = primary_uri
-
-        # Upload quarterly if provided
-        quarterly_uri = None
-        if quarterly_bytes:
-            quarterly_uri = upload_pdf_to_gemini(quarterly_bytes, "quarterly_report.pdf")
+            page_counts[primary_uri] = total_pages
 
         # Step 4: Extract holding chart
         logger.info("Step 4: Extracting holding chart...")
@@ -271,7 +324,8 @@ async def process_report_async(request: GenerateReportRequest):
 
         if GOOGLE_API_KEY:
             with tempfile.TemporaryDirectory() as temp_dir:
-                holding_chart_path = extract_holding_chart_page(
+                holding_chart_path = await asyncio.to_thread(
+                    extract_holding_chart_page,
                     pdf_bytes=annual_bytes,
                     output_dir=Path(temp_dir),
                     google_api_key=GOOGLE_API_KEY,
@@ -281,37 +335,43 @@ async def process_report_async(request: GenerateReportRequest):
 
         # Step 5: Generate all sections
         logger.info("Step 5: Generating report sections...")
-        html_sections = []
-        failed_sections = []
+        section_uris = {}
+        board_primary_uri = board_uri or financial_uri
+        financial_primary_uri = financial_uri or board_uri
 
         for section_id in SECTIONS:
-            logger.info(f"  Generating: {SECTION_DISPLAY_NAMES.get(section_id, section_id)}")
-
             if is_heavy:
                 if section_id in BOARD_REPORT_SECTIONS:
-                    section_uri = board_uri or financial_uri
+                    section_uris[section_id] = board_primary_uri
                 else:
-                    section_uri = financial_uri or board_uri
+                    section_uris[section_id] = financial_primary_uri
             else:
-                section_uri = board_uri
-
-            section_html = generate_section_with_fallback(
-                section_id=section_id,
-                primary_uri=section_uri,
-                secondary_uri=quarterly_uri,
-                fallback_uri=section_uri,
-                company_name=company_name
-            )
+                section_uris[section_id] = board_uri
+
+        section_results = await asyncio.to_thread(
+            generate_sections,
+            section_uris=section_uris,
+            secondary_uri=quarterly_uri,
+            company_name=company_name,
+            page_counts=page_counts
+        )
 
+        html_sections = []
+        failed_sections = []
+
+        for section_id in SECTIONS:
+            section_html = section_results[section_id]
             html_sections.append(section_html)
 
             if section_id == 'company_profile':
                 html_sections.append(holding_chart_html)
 
-            if 'class="error"' in section_html:
+            if not is_section_ok(section_html):
                 failed_sections.append(section_id)
 
-            time.sleep(API_DELAY)
+        # Nothing to render - fail the report instead of uploading error boxes
+        if len(failed_sections) == len(SECTIONS):
+            raise Exception("All report sections failed to generate")
 
         # Step 6: Assemble final report
         logger.info("Step 6: Assembling final report...")
@@ -319,7 +379,7 @@ async def process_report_async(request: GenerateReportRequest):
 
         # Step 7: Convert to PDF
         logger.info("Step 7: Converting to PDF...")
-        pdf_bytes = html_to_pdf(final_html)
+        pdf_bytes = await asyncio.to_thread(html_to_pdf, final_html)
 
         # Step 8: Upload to Supabase
         logger.info("Step 8: Uploading to Supabase...")
@@ -361,7 +421,7 @@ async def process_report_async(request: GenerateReportRequest):
 @app.on_event("startup")
 async def startup_event():
     """Initialize on startup."""
-    global _model
+    global _model, _pdf_pool, _http_client
 
     # Validate core config
     is_valid, errors = validate_config()
@@ -384,6 +444,24 @@ async def startup_event():
         logger.error(f"Failed to configure Gemini: {e}")
         raise
 
+    # Workers are spawned on first use, not here
+    _pdf_pool = ProcessPoolExecutor(
+        max_workers=MAX_PDF_WORKERS, mp_context=multiprocessing.get_context("spawn")
+    )
+
+    _http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=32, max_keepalive_connections=16)
+    )
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the PDF worker processes and close the HTTP client."""
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(cancel_futures=True)
+    if _http_client is not None:
+        await _http_client.aclose()
+
 
 # =============================================================================
 # API ENDPOINTS